@@ -0,0 +1,118 @@
+# =============================================================================
+#
+# ALIASES
+#
+# Finding the student behind a username that variables.txt doesn't know.
+# Every known alias and real name is indexed by its letter trigrams, so a
+# lookup only scores the few names that share the most trigrams with it,
+# however many there are. Mappings the teacher confirms are kept in a small
+# JSON file and read back on every run, alongside variables.txt.
+#
+# =============================================================================
+
+from __future__ import annotations
+from collections import Counter
+from difflib import SequenceMatcher
+from pathlib import Path
+import json
+import os
+
+# Suggestions offered for each unknown username
+SUGGESTIONS = 3
+
+# Names scored in full per lookup, out of those sharing the most trigrams
+CANDIDATES = 20
+
+# Below this similarity (0 to 1) a name isn't worth suggesting
+CUTOFF = 0.5
+
+# Classes
+
+class AliasIndex:
+    names: dict[str, str]
+    trigrams: dict[str, list[str]]
+
+    def __init__(self: AliasIndex, names: dict[str, str]) -> None:
+        """
+        names maps every known alias and real name to the real name.
+        """
+        self.names = {}
+        self.trigrams = {}
+
+        for (key, real) in names.items():
+            key = squash(key)
+            if key in self.names:
+                continue
+
+            self.names[key] = real
+            for t in get_trigrams(key):
+                self.trigrams.setdefault(t, []).append(key)
+
+    def suggest(self: AliasIndex, alias: str, n: int=SUGGESTIONS) -> list[str]:
+        """
+        Real names, best first.
+        """
+        key = squash(alias)
+        shared = Counter(k for t in get_trigrams(key) for k in self.trigrams.get(t, ()))
+
+        scored = sorted(
+            ((SequenceMatcher(None, key, k).ratio(), k) for (k, _) in shared.most_common(CANDIDATES)),
+            reverse=True
+        )
+
+        suggestions = []
+        for (score, k) in scored:
+            if score < CUTOFF or len(suggestions) == n:
+                break
+
+            if self.names[k] not in suggestions:
+                suggestions.append(self.names[k])
+
+        return suggestions
+
+class AliasCache:
+    path: Path
+    confirmed: dict[str, str]
+    dirty: bool
+
+    def __init__(self: AliasCache, path: Path) -> None:
+        self.path = path
+        self.confirmed = {}
+        self.dirty = False
+
+    def load(self: AliasCache) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.confirmed = json.load(f)
+        except (OSError, ValueError):
+            return
+
+    def save(self: AliasCache) -> None:
+        if not self.dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix('.tmp')
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.confirmed, f, indent=1, sort_keys=True)
+
+        os.replace(temp, self.path)
+        self.dirty = False
+
+    def confirm(self: AliasCache, alias: str, real: str) -> None:
+        self.confirmed[alias] = real
+        self.dirty = True
+
+# Helpers
+
+def normalize(name: str) -> str:
+    return ' '.join(name.lower().split())
+
+def squash(name: str) -> str:
+    # Usernames tend to be a name run together with some digits
+    letters = ''.join(c for c in name.lower() if c.isalpha())
+    return letters or normalize(name)
+
+def get_trigrams(s: str) -> set[str]:
+    padded = f'  {s} '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
@@ -0,0 +1,207 @@
+# =============================================================================
+#
+# BATCH
+#
+# Marks every classroom under one directory in a single run. Each classroom
+# is a folder with its own variables.txt and input/, like this:
+#
+#   sections/
+#       fsf1d-s1/
+#           variables.txt
+#           input/2024-09-02 2024-09-08.csv
+#       fsf1d-s2/
+#           ...
+#
+# Each gets output/final_report.xlsx and .txt, and the whole batch gets
+# summary.csv.
+#
+# Classrooms are marked in a process pool, so marking and writing use every
+# core, not just parsing. A classroom whose files are all in its parse cache
+# is done in one task. Otherwise the task hands back the files to read, they
+# are parsed across the pool, and a second task marks the classroom and
+# writes its reports. Only so many classrooms are in flight at once, so
+# parsed files don't pile up in memory waiting to be marked.
+#
+# =============================================================================
+
+from __future__ import annotations
+import argparse
+import asyncio
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import process
+from render import TextSink
+
+if TYPE_CHECKING:
+    from parse_cache import ParseCache
+    from process import DuolingoMarker, ParsedFile
+
+SUMMARY_NAME = 'summary.csv'
+SUMMARY_FIELDS = [
+    'classroom', 'students', 'weeks', 'goal xp',
+    'total xp', 'weekly xp', '100% weeks', '50% weeks', 'xp mark', 'consistency mark',
+    'error',
+]
+
+# Classrooms in flight beyond one per worker
+QUEUE_DEPTH = 2
+
+# Operations
+
+def find_classrooms(base: Path) -> list[Path]:
+    return sorted(p for p in base.iterdir() if (p / 'variables.txt').is_file())
+
+def mark_classroom(root: Path) -> dict[str]:
+    try:
+        d = process.make_marker(root, workers=1)
+        report = d.calculate_final_report()
+        save_reports(d, report)
+
+    # One broken section shouldn't stop the rest
+    except Exception as e:
+        return make_error_row(root, e)
+
+    return make_row(root, d, report)
+
+def mark_classrooms(roots: list[Path], workers: int=0) -> list[dict[str]]:
+    if workers == 1 or len(roots) < 2:
+        return list(map(mark_classroom, roots))
+
+    # The store keeps its own track of what has been read, so each classroom is marked whole
+    if process.USE_STORE:
+        with ProcessPoolExecutor(max_workers=workers or None) as pool:
+            return list(pool.map(mark_classroom, roots))
+
+    return asyncio.run(mark_pipeline(roots, workers))
+
+async def mark_pipeline(roots: list[Path], workers: int=0) -> list[dict[str]]:
+    """
+    Each classroom as start_classroom, then if need be its missing files and finish_classroom, all in one process pool.
+    """
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore((workers or os.cpu_count() or 1) + QUEUE_DEPTH)
+
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        async def mark(root: Path) -> dict[str]:
+            async with in_flight:
+                started = await loop.run_in_executor(pool, start_classroom, root)
+                if isinstance(started, dict):
+                    return started
+
+                # A big classroom's files are spread over every worker
+                results = await asyncio.gather(
+                    *(loop.run_in_executor(pool, process.read_input_file, path) for path in started),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        return make_error_row(root, result)
+
+                return await loop.run_in_executor(pool, finish_classroom, root, dict(zip(started, results)))
+
+        return await asyncio.gather(*map(mark, roots))
+
+def open_classroom(root: Path) -> tuple[DuolingoMarker, ParseCache, dict[Path, ParsedFile | None]]:
+    d = process.DuolingoMarker(root)
+    d.parse_variables()
+    cache, parsed = d.check_input_files(d.get_input_paths())
+    return d, cache, parsed
+
+def start_classroom(root: Path) -> dict[str] | list[Path]:
+    """
+    The classroom's summary row if nothing needs parsing, otherwise the files to read first.
+    """
+    try:
+        d, cache, parsed = open_classroom(root)
+
+        missing = [path for (path, result) in parsed.items() if result is None]
+        if missing:
+            return missing
+
+        return complete_classroom(root, d, cache, parsed)
+
+    # One broken section shouldn't stop the rest
+    except Exception as e:
+        return make_error_row(root, e)
+
+def finish_classroom(root: Path, read: dict[Path, ParsedFile]) -> dict[str]:
+    """
+    read is the files start_classroom handed back, now parsed.
+    """
+    try:
+        d, cache, parsed = open_classroom(root)
+
+        for (path, result) in parsed.items():
+            if result is None:
+                # Anything that changed since start_classroom looked is read here
+                result = read[path] if path in read else process.read_input_file(path)
+                parsed[path] = result
+                cache.put(path, result)
+
+        return complete_classroom(root, d, cache, parsed)
+
+    except Exception as e:
+        return make_error_row(root, e)
+
+def complete_classroom(root: Path, d: DuolingoMarker, cache: ParseCache, parsed: dict[Path, ParsedFile]) -> dict[str]:
+    d.ingest_input_files(cache, parsed)
+    report = d.calculate_final_report()
+    save_reports(d, report)
+    return make_row(root, d, report)
+
+def save_reports(d: DuolingoMarker, report: dict[str]) -> None:
+    d.save_final_report(report)
+
+    path = d.path_output / 'final_report.txt'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        d.render_final_report(TextSink(f), report)
+    print(f'Saved report to {path}')
+
+def make_row(root: Path, d: DuolingoMarker, report: dict[str]) -> dict[str]:
+    row = {'classroom': root.name}
+    row['students'] = len(d.students)
+    row['weeks'] = report['totals']['weeks']
+    row['goal xp'] = report['totals']['xp']
+    row.update(report['averages'])
+    return row
+
+def make_error_row(root: Path, e: Exception) -> dict[str]:
+    return {'classroom': root.name, 'error': f'{type(e).__name__}: {e}'}
+
+def save_summary(rows: list[dict[str]], path: Path) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f'Saved summary to {path}')
+
+# Programs
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description='Mark every classroom under a directory.')
+    parser.add_argument('base', type=Path, help='directory containing one folder per classroom')
+    parser.add_argument('--workers', type=int, default=0, help='classrooms marked at once (default: one per core)')
+    args = parser.parse_args()
+
+    roots = find_classrooms(args.base)
+    if not roots:
+        print(f'No classrooms found under {args.base}')
+        return
+
+    rows = mark_classrooms(roots, args.workers)
+    for row in rows:
+        if 'error' in row:
+            print(f'{row["classroom"]}: {row["error"]}')
+
+    save_summary(rows, args.base / SUMMARY_NAME)
+
+# Go
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,331 @@
+# =============================================================================
+#
+# BENCHMARK
+#
+# Times each stage of marking against generated classrooms of different
+# sizes. The generator is deterministic, so the same arguments always give
+# the same files. Every result is appended to benchmarks/results.jsonl and
+# compared with the last recorded time for the same case.
+#
+#   python benchmark.py                          full grid, within --max-practices
+#   python benchmark.py --students 100 --weeks 10,50
+#   python benchmark.py --keep some/dir          leave the generated files behind
+#   python benchmark.py --startup                only check the import-time budget
+#
+# The import-time budget is enforced: going over it, or importing one of the
+# heavy libraries at startup, makes the run exit with an error.
+#
+# =============================================================================
+
+from __future__ import annotations
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import process
+import process_from_activity
+
+PATH_BASE = Path(__file__).parent
+PATH_RESULTS = PATH_BASE / 'benchmarks' / 'results.jsonl'
+
+DEFAULT_STUDENTS = [10, 100, 1_000, 10_000, 100_000]
+DEFAULT_WEEKS = [1, 10, 50, 200]
+DEFAULT_MAX_PRACTICES = 2_000_000
+
+# Activity records per student per week
+ACTIVITY_RATE = 3
+
+# Slower than this many times the last recorded run gets flagged
+REGRESSION_RATIO = 1.25
+
+# Seconds an import may add to a bare interpreter's startup, so the text reports open promptly
+STARTUP_BUDGET = 0.1
+STARTUP_MODULES = ['process', 'process_from_activity']
+
+# Only the reports that need these should pay for them
+LAZY_MODULES = ['numpy', 'openpyxl', 'sqlite3', 'concurrent.futures.process']
+
+FIRST_MONDAY = datetime.date(2024, 9, 2)
+
+CSV_HEADER = 'Full name,Username,Email,Classroom,Language,Streak,Units completed,Total units in course,Percent completed,Days active,Total XP,Time Spent Learning,Lessons,Stories,Other,Level Review,Ramp Up Challenge,Mistakes Review,Practice,Listening exercises'
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'sa', 'tu', 'vel', 'zo', 'an', 'bri', 'do', 'fe']
+VERBS = ['practiced French', 'completed a lesson in French', 'tested out of a unit']
+XPS = [0, 10, 15, 20, 30, 40, 45, 49, 50, 51, 60, 99, 100, 120, 150, 400]
+
+# Generator
+
+def make_names(n: int, rng: random.Random) -> list[str]:
+    names = []
+    for i in range(n):
+        first = ''.join(rng.choice(SYLLABLES) for _ in range(2))
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(3))
+
+        # Suffixed so they stay unique however many there are, in letters for RE_NAME
+        names.append(f'{first} {last} {to_letters(i)}')
+
+    return names
+
+def to_letters(i: int) -> str:
+    s = ''
+    while True:
+        i, r = divmod(i, 26)
+        s = chr(ord('a') + r) + s
+        if not i:
+            return s
+
+def make_main_classroom(root: Path, students: int, weeks: int, seed: int=0) -> None:
+    """
+    A classroom for process.py: alias lines in variables.txt and one main panel csv per week.
+    """
+    rng = random.Random(seed)
+    names = make_names(students, rng)
+    usernames = [f'{name.replace(" ", "")}{rng.randrange(100)}' for name in names]
+
+    (root / 'input').mkdir(parents=True, exist_ok=True)
+
+    lines = ['goal::100']
+    for w in range(7, weeks, 17):
+        lines.append(f'bonus week end::{FIRST_MONDAY + datetime.timedelta(weeks=w, days=6)}')
+
+    for (name, username) in zip(names, usernames):
+        lines.append(f'alias::{username}=={name}')
+
+    lines.append('alias::teacher==-')
+    (root / 'variables.txt').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    for w in range(weeks):
+        start = FIRST_MONDAY + datetime.timedelta(weeks=w)
+        end = start + datetime.timedelta(days=6)
+
+        with open(root / 'input' / f'{start} {end}.csv', 'w', encoding='utf-8') as f:
+            f.write(CSV_HEADER + '\n')
+
+            for (name, username) in zip(names + ['teacher'], usernames + ['teacher']):
+                xp = rng.choice(XPS)
+                f.write(f'{name},{username},{username}@example.com,FSF1D,French,{rng.randrange(300)},0,273,0%,0,{xp},0h 0m,0,0,0,0,0,0,0,0\n')
+
+def make_activity_classroom(root: Path, students: int, weeks: int, seed: int=0) -> None:
+    """
+    A classroom for process_from_activity.py: a students block in variables.txt and one
+    activity paste per week, newest first, with both of the date formats it accepts.
+    """
+    rng = random.Random(seed)
+    names = make_names(students, rng)
+
+    (root / 'input').mkdir(parents=True, exist_ok=True)
+
+    lines = ['goal::100', '', 'bonus weeks::0', '', f'students::{len(names)}']
+    lines.extend(f'{name}::' for name in names)
+    (root / 'variables.txt').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    for w in range(weeks):
+        start = datetime.datetime.combine(FIRST_MONDAY + datetime.timedelta(weeks=w), datetime.time())
+        records = []
+
+        for name in names:
+            for _ in range(ACTIVITY_RATE):
+                dt = start + datetime.timedelta(minutes=rng.randrange(7 * 24 * 60))
+                records.append((dt, name))
+
+        records.sort(reverse=True)
+
+        with open(root / 'input' / f'{start.date()}.txt', 'w', encoding='utf-8') as f:
+            for (dt, name) in records:
+                f.write(f'{name.title()} {rng.choice(VERBS)}\n+{rng.choice(XPS)} XP\n{format_activity_date(dt, rng)}\n\n')
+
+def format_activity_date(dt: datetime.datetime, rng: random.Random) -> str:
+    date = f'{dt:%b} {dt.day}, {dt.year}'
+
+    if rng.random() < 0.5:
+        return f'{date} {dt.hour} h {dt:%M}'
+
+    hour = dt.hour % 12 or 12
+    return f'{date} {hour}:{dt:%M} {"a.m." if dt.hour < 12 else "p.m."}'
+
+# Timing
+
+def timed(f: Callable[[], object], repeat: int) -> tuple[float, object]:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+def bench_main(root: Path, repeat: int) -> dict[str, float]:
+    times = {}
+
+    def parse() -> process.DuolingoMarker:
+        d = process.DuolingoMarker(root)
+        d.parse_variables()
+        d.parse_input_files(use_cache=False)
+        return d
+
+    # The calendar is kept once built, so each of these starts without one, as a run's first call does
+    def get_weeks() -> list[tuple[datetime.date]]:
+        d.calendar = None
+        return d.get_weeks()
+
+    def get_week_numbers() -> list[str]:
+        d.calendar = None
+        return d.get_week_numbers(weeks)
+
+    times['parse'], d = timed(parse, repeat)
+    times['get_weeks'], weeks = timed(get_weeks, repeat)
+    times['get_week_numbers'], _ = timed(get_week_numbers, repeat)
+    times['calculate_final_report'], report = timed(lambda: d.calculate_final_report(use_cache=False), repeat)
+
+    # Every week already saved, as on the run after a new week's export
+    d.calculate_final_report()
+    times['calculate_final_report cached'], _ = timed(d.calculate_final_report, repeat)
+    times['save_final_report'], _ = timed(lambda: d.save_final_report(report), repeat)
+
+    return times
+
+def bench_activity(root: Path, repeat: int) -> dict[str, float]:
+    paths = sorted((root / 'input').glob('*.txt'))
+    times = {}
+    times['parse'], _ = timed(lambda: process_from_activity.read_input_files(paths), repeat)
+
+    # Every record pasted twice, as when each paste reaches back past the last one
+    times['parse overlapping'], _ = timed(lambda: process_from_activity.read_input_files(paths + paths), repeat)
+
+    return times
+
+def bench_startup(repeat: int) -> dict[str, float]:
+    """
+    Each is a fresh interpreter, less the time a bare one takes.
+    """
+    bare = time_python('pass', repeat)
+    return {f'import {name}': max(0.0, time_python(f'import {name}', repeat) - bare) for name in STARTUP_MODULES}
+
+def time_python(code: str, repeat: int) -> float:
+    # Process startup is noisy, so always take the best of a few
+    best = None
+    for _ in range(max(repeat, 5)):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=PATH_BASE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def find_eager_imports(name: str) -> list[str]:
+    code = f'import sys, {name}; print(*(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    out = subprocess.run([sys.executable, '-c', code], cwd=PATH_BASE, capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+# Results
+
+def load_results(path: Path) -> dict[tuple, float]:
+    last = {}
+    if not path.exists():
+        return last
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            r = json.loads(line)
+            last[(r['source'], r['students'], r['weeks'], r['stage'])] = r['seconds']
+
+    return last
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PATH_BASE, capture_output=True, text=True)
+    except OSError:
+        return None
+
+    return out.stdout.strip() or None
+
+def parse_sizes(s: str) -> list[int]:
+    return [int(x.replace('_', '')) for x in s.split(',')]
+
+# Programs
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description='Time each marking stage against generated classrooms.')
+    parser.add_argument('--students', type=parse_sizes, default=DEFAULT_STUDENTS, help='comma-separated roster sizes')
+    parser.add_argument('--weeks', type=parse_sizes, default=DEFAULT_WEEKS, help='comma-separated numbers of weeks')
+    parser.add_argument('--max-practices', type=int, default=DEFAULT_MAX_PRACTICES, help='skip cases with more students x weeks than this')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage; the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', type=Path, help='generate into this directory and leave it there')
+    parser.add_argument('--results', type=Path, default=PATH_RESULTS, help='where to append results')
+    parser.add_argument('--startup', action='store_true', help='only check the import-time budget')
+    args = parser.parse_args()
+
+    last = load_results(args.results)
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+
+    meta = {
+        'when': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+    }
+
+    with tempfile.TemporaryDirectory() as temp, open(args.results, 'a', encoding='utf-8') as out:
+        base = args.keep or Path(temp)
+
+        def record(source: str, students: int, weeks: int, stage: str, seconds: float) -> None:
+            key = (source, students, weeks, stage)
+            note = ''
+            if key in last and last[key] > 0:
+                ratio = seconds / last[key]
+                note = f'  ({ratio:.2f}x last run{", REGRESSION" if ratio > REGRESSION_RATIO else ""})'
+
+            print(f'{students:>7} students x {weeks:>3} weeks  {source:<8} {stage:<30} {seconds:>9.4f}s{note}')
+
+            r = dict(meta, source=source, students=students, weeks=weeks, stage=stage, seconds=round(seconds, 6))
+            out.write(json.dumps(r) + '\n')
+
+        failures = []
+
+        for (stage, seconds) in bench_startup(args.repeat).items():
+            record('startup', 0, 0, stage, seconds)
+            if seconds > STARTUP_BUDGET:
+                failures.append(f'{stage} took {seconds:.3f}s, over the {STARTUP_BUDGET}s budget')
+
+        for name in STARTUP_MODULES:
+            for module in find_eager_imports(name):
+                failures.append(f'import {name} also imports {module}')
+
+        for students in ([] if args.startup else args.students):
+            for weeks in args.weeks:
+                if students * weeks > args.max_practices:
+                    print(f'{students:>7} students x {weeks:>3} weeks: skipped (over --max-practices)')
+                    continue
+
+                for (source, make, bench) in [
+                    ('main', make_main_classroom, bench_main),
+                    ('activity', make_activity_classroom, bench_activity),
+                ]:
+                    root = base / f'{source} {students}x{weeks}'
+                    make(root, students, weeks, args.seed)
+
+                    for (stage, seconds) in bench(root, args.repeat).items():
+                        record(source, students, weeks, stage, seconds)
+
+    for failure in failures:
+        print(f'STARTUP BUDGET: {failure}')
+
+    if failures:
+        sys.exit(1)
+
+# Go
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,133 @@
+# =============================================================================
+#
+# EXPORT
+#
+# Writes the marking matrix for other tools to load: one row per student with
+# their XP in every week and their stats, plus one row per week with its
+# label and dates. Both tables come in CSV, JSON Lines or Parquet. Rows are
+# written from the NumPy columns a block at a time, never cell by cell.
+#
+# Parquet needs pyarrow (pip install pyarrow); the other formats need nothing.
+#
+# =============================================================================
+
+from __future__ import annotations
+import csv
+import datetime
+import json
+from pathlib import Path
+from typing import Iterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+FORMATS = ['csv', 'jsonl', 'parquet']
+
+# Students converted to Python values at a time
+BLOCK_ROWS = 10_000
+
+# Classes
+
+class MarkingTable:
+    """
+    Students in rows and weeks in columns, with each stat as a column of its own.
+    """
+    names: list[str]
+    weeks: list[tuple[datetime.date]]
+    numbers: list[str]
+    goal: int
+    matrix: np.ndarray
+    stats: dict[str, np.ndarray]
+
+    def __init__(self: MarkingTable, names: list[str], weeks: list[tuple[datetime.date]], numbers: list[str], goal: int, matrix: np.ndarray, stats: dict[str, np.ndarray]) -> None:
+        self.names = names
+        self.weeks = weeks
+        self.numbers = numbers
+        self.goal = goal
+        self.matrix = matrix
+        self.stats = stats
+
+    def get_week_columns(self: MarkingTable) -> list[str]:
+        # Labels repeat for bonus weeks, so the start date names each week's column
+        return [start.isoformat() for (start, _) in self.weeks]
+
+    def get_student_header(self: MarkingTable) -> list[str]:
+        return ['student'] + self.get_week_columns() + list(self.stats)
+
+    def iter_student_rows(self: MarkingTable) -> Iterator[list]:
+        columns = list(self.stats.values())
+
+        for lo in range(0, len(self.names), BLOCK_ROWS):
+            hi = lo + BLOCK_ROWS
+            xps = self.matrix[lo:hi].tolist()
+            stats = zip(*(c[lo:hi].tolist() for c in columns))
+
+            for (name, row, values) in zip(self.names[lo:hi], xps, stats):
+                yield [name, *row, *values]
+
+    def get_week_header(self: MarkingTable) -> list[str]:
+        return ['column', 'week', 'start', 'end', 'bonus', 'goal xp']
+
+    def iter_week_rows(self: MarkingTable, bonus: str) -> Iterator[list]:
+        for (column, (start, end), number) in zip(self.get_week_columns(), self.weeks, self.numbers):
+            yield [column, number.strip(), start.isoformat(), end.isoformat(), number == bonus, self.goal]
+
+# Operations
+
+def export_table(table: MarkingTable, directory: Path, fmt: str, bonus: str) -> list[Path]:
+    """
+    Writes students.<fmt> and weeks.<fmt>. bonus is the label get_week_numbers gives bonus weeks.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [directory / f'students.{fmt}', directory / f'weeks.{fmt}']
+
+    if fmt == 'parquet':
+        write_parquet(table, paths, bonus)
+        return paths
+
+    write = write_csv if fmt == 'csv' else write_jsonl
+    write(paths[0], table.get_student_header(), table.iter_student_rows())
+    write(paths[1], table.get_week_header(), table.iter_week_rows(bonus))
+
+    return paths
+
+def write_csv(path: Path, header: list[str], rows: Iterator[list]) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def write_jsonl(path: Path, header: list[str], rows: Iterator[list]) -> None:
+    # Each line is one object, filled into a template so the keys are only encoded once
+    template = '{' + ', '.join(json.dumps(k).replace('%', '%%') + ': %s' for k in header) + '}\n'
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(template % tuple(map(encode_json, row)))
+
+def encode_json(value: object) -> str:
+    # Most values are plain ints, which are already valid JSON as they print
+    return str(value) if type(value) is int else json.dumps(value)
+
+def write_parquet(table: MarkingTable, paths: list[Path], bonus: str) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)') from None
+
+    # Straight from the NumPy columns
+    students = {'student': pa.array(table.names, pa.string())}
+    for (j, column) in enumerate(table.get_week_columns()):
+        students[column] = table.matrix[:, j]
+    students.update(table.stats)
+
+    weeks = dict(zip(table.get_week_header(), map(list, zip(*table.iter_week_rows(bonus)))))
+    if not table.weeks:
+        weeks = {k: [] for k in table.get_week_header()}
+
+    pq.write_table(pa.table(students), paths[0])
+    pq.write_table(pa.table(weeks), paths[1])
@@ -0,0 +1,126 @@
+# =============================================================================
+#
+# PARSE CACHE
+#
+# Keeps the parsed contents of each input file on disk so that a run only
+# reparses files that are new or have changed. A file is trusted as-is if its
+# size and mtime match; otherwise its content hash decides. Entries remember
+# the order they were put in, for results that depend on the files read
+# before them.
+#
+# =============================================================================
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable
+import hashlib
+import os
+import pickle
+
+CACHE_VERSION = 4
+
+# Classes
+
+class ParseCache:
+    path: Path
+    entries: dict[str, dict]
+    seen: set[str]
+    order: int
+    dirty: bool
+
+    def __init__(self: ParseCache, path: Path) -> None:
+        self.path = path
+        self.entries = {}
+        self.seen = set()
+        self.order = 0
+        self.dirty = False
+
+    def load(self: ParseCache) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                version, entries = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return
+
+        if version == CACHE_VERSION:
+            self.entries = entries
+            self.order = max((e['order'] for e in entries.values()), default=0)
+
+    def save(self: ParseCache) -> None:
+        if not self.dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix('.tmp')
+        with open(temp, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, self.path)
+        self.dirty = False
+
+    def get(self: ParseCache, path: Path) -> object | None:
+        key = str(path.resolve())
+        self.seen.add(key)
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        stat = path.stat()
+        if (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime_ns):
+            return entry['result']
+
+        # Touched, but maybe not changed
+        if entry['size'] == stat.st_size and entry['hash'] == hash_file(path):
+            entry['mtime'] = stat.st_mtime_ns
+            self.dirty = True
+            return entry['result']
+
+        return None
+
+    def put(self: ParseCache, path: Path, result: object) -> None:
+        key = str(path.resolve())
+        self.seen.add(key)
+
+        stat = path.stat()
+        self.entries[key] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': hash_file(path),
+            'result': result,
+            'order': self.order + 1,
+        }
+        self.order += 1
+        self.dirty = True
+
+    def digest(self: ParseCache, path: Path) -> str | None:
+        """
+        The content hash of a file that has been through get or put.
+        """
+        entry = self.entries.get(str(path.resolve()))
+        return entry and entry['hash']
+
+    def evict_since(self: ParseCache, keys: Iterable[str]) -> None:
+        """
+        Drops the entries for keys and every entry put after the earliest of them.
+        """
+        orders = [self.entries[key]['order'] for key in keys if key in self.entries]
+        if not orders:
+            return
+
+        first = min(orders)
+        for key in [k for (k, e) in self.entries.items() if e['order'] >= first]:
+            del self.entries[key]
+
+        self.dirty = True
+
+    def evict_unseen(self: ParseCache) -> None:
+        for key in set(self.entries) - self.seen:
+            del self.entries[key]
+            self.dirty = True
+
+# Helpers
+
+def hash_file(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
@@ -0,0 +1,256 @@
+# =============================================================================
+#
+# PRACTICE STORE
+#
+# An optional SQLite home for one classroom's practices, so that each export
+# is only ever read once. Files that have been ingested are remembered by
+# path, size, mtime and content hash: as in the parse cache, a file whose
+# size and mtime match is trusted without being read, and otherwise its hash
+# decides whether it has really changed. The store follows input/: a file that leaves it
+# takes its practices with it, so a renamed export isn't counted twice and
+# the reports match those made without the store.
+#
+# =============================================================================
+
+from __future__ import annotations
+import datetime
+import os
+import sqlite3
+from pathlib import Path
+from typing import Callable, Iterable, TYPE_CHECKING
+
+from aliases import normalize
+from parse_cache import hash_file
+
+if TYPE_CHECKING:
+    import numpy as np
+    from process import DuolingoMarker, ParsedFile, Student
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    student_id INTEGER REFERENCES students(id)
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    hash TEXT NOT NULL,
+    size INTEGER,
+    mtime INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS dates (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS practices (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    alias TEXT NOT NULL,
+    student_id INTEGER REFERENCES students(id),
+    desc TEXT NOT NULL,
+    xp INTEGER NOT NULL,
+    ts TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS practices_student_ts ON practices (student_id, ts);
+CREATE INDEX IF NOT EXISTS practices_ts ON practices (ts);
+CREATE INDEX IF NOT EXISTS practices_file ON practices (file_id);
+CREATE INDEX IF NOT EXISTS practices_alias ON practices (alias);
+CREATE INDEX IF NOT EXISTS dates_file ON dates (file_id);
+'''
+
+# Classes
+
+class PracticeStore:
+    path: Path
+    db: sqlite3.Connection
+
+    def __init__(self: PracticeStore, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+        # Stores made before files had a size and mtime; their files are hashed once more to fill them in
+        columns = set(row[1] for row in self.db.execute('PRAGMA table_info(files)'))
+        with self.db:
+            for column in ('size', 'mtime'):
+                if column not in columns:
+                    self.db.execute(f'ALTER TABLE files ADD COLUMN {column} INTEGER')
+
+    def close(self: PracticeStore) -> None:
+        self.db.close()
+
+    def sync_variables(self: PracticeStore, marker: DuolingoMarker) -> None:
+        """
+        Mirror the students and aliases from variables.txt, re-resolving old practices if they changed.
+        """
+        with self.db:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO students (name) VALUES (?)',
+                ((name,) for name in marker.students)
+            )
+            ids = dict(self.db.execute('SELECT name, id FROM students'))
+
+            aliases = {alias: ids[s.name] for (alias, s) in marker.aliases.items()}
+            aliases.update((alias, None) for alias in marker.skips)
+
+            if aliases == dict(self.db.execute('SELECT alias, student_id FROM aliases')):
+                return
+
+            self.db.execute('DELETE FROM aliases')
+            self.db.executemany('INSERT INTO aliases VALUES (?, ?)', aliases.items())
+            self.db.execute(
+                'UPDATE practices SET student_id = (SELECT a.student_id FROM aliases a WHERE a.alias = practices.alias)'
+            )
+
+    def ingest_files(self: PracticeStore, paths: Iterable[Path], read: Callable[[list[Path]], Iterable[ParsedFile]]) -> int:
+        """
+        read takes the list of new or changed paths and gives back their contents in the same order.
+        Files no longer among paths are dropped.
+        """
+        known = {path: (digest, size, mtime) for (path, digest, size, mtime) in self.db.execute('SELECT path, hash, size, mtime FROM files')}
+        unseen = []
+        touched = []
+        keys = set()
+
+        for path in paths:
+            key = str(path.resolve())
+            stat = path.stat()
+            keys.add(key)
+
+            entry = known.get(key)
+            if entry is not None and entry[1:] == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            # Touched, but maybe not changed
+            digest = hash_file(path)
+            if entry is not None and entry[0] == digest:
+                touched.append((stat.st_size, stat.st_mtime_ns, key))
+            else:
+                unseen.append((path, key, digest, stat))
+
+        # Their dates and practices go with them
+        with self.db:
+            self.db.executemany('DELETE FROM files WHERE path = ?', ((key,) for key in known.keys() - keys))
+            self.db.executemany('UPDATE files SET size = ?, mtime = ? WHERE path = ?', touched)
+
+        for ((_, key, digest, stat), parsed) in zip(unseen, read([path for (path, _, _, _) in unseen])):
+            self.ingest(key, digest, stat, parsed)
+
+        return len(unseen)
+
+    def ingest(self: PracticeStore, key: str, digest: str, stat: os.stat_result, parsed: ParsedFile) -> None:
+        dates, records = parsed
+
+        with self.db:
+            # A changed file replaces everything it contributed before
+            self.db.execute('DELETE FROM files WHERE path = ?', (key,))
+            file_id = self.db.execute(
+                'INSERT INTO files (path, hash, size, mtime) VALUES (?, ?, ?, ?)',
+                (key, digest, stat.st_size, stat.st_mtime_ns)
+            ).lastrowid
+
+            self.db.executemany(
+                'INSERT INTO dates VALUES (?, ?)',
+                ((file_id, date.isoformat()) for date in dates)
+            )
+            self.db.executemany(
+                '''INSERT INTO practices (file_id, alias, student_id, desc, xp, ts)
+                   SELECT ?1, ?2, (SELECT student_id FROM aliases WHERE alias = ?2), ?3, ?4, ?5''',
+                ((file_id, normalize(alias), desc, xp, dt.isoformat(' ')) for (alias, desc, xp, dt) in records)
+            )
+
+    def get_unknown_aliases(self: PracticeStore) -> dict[str, int]:
+        """
+        Rows per username that variables.txt doesn't know, as find_unknown_aliases gives them.
+        """
+        rows = self.db.execute(
+            '''SELECT p.alias, COUNT(*)
+               FROM practices p LEFT JOIN aliases a ON a.alias = p.alias
+               WHERE a.alias IS NULL
+               GROUP BY p.alias'''
+        )
+
+        return dict(rows)
+
+    def get_dates(self: PracticeStore) -> set[datetime.date]:
+        rows = self.db.execute('SELECT DISTINCT date FROM dates')
+        return set(datetime.date.fromisoformat(d) for (d,) in rows)
+
+    def get_files(self: PracticeStore) -> dict[str, tuple[str, datetime.date, datetime.date]]:
+        """
+        Every file ever ingested, with its hash and the first and last dates it covers.
+        """
+        rows = self.db.execute(
+            '''SELECT f.path, f.hash, MIN(d.date), MAX(d.date)
+               FROM files f JOIN dates d ON d.file_id = f.id
+               GROUP BY f.id'''
+        )
+
+        return {
+            path: (digest, datetime.date.fromisoformat(first), datetime.date.fromisoformat(last))
+            for (path, digest, first, last) in rows
+        }
+
+    def xp_between(self: PracticeStore, name: str, start: datetime.datetime, end: datetime.datetime) -> int:
+        (xp,) = self.db.execute(
+            '''SELECT COALESCE(SUM(p.xp), 0)
+               FROM practices p JOIN students s ON s.id = p.student_id
+               WHERE s.name = ? AND p.ts BETWEEN ? AND ?''',
+            (name, start.isoformat(' '), end.isoformat(' '))
+        ).fetchone()
+
+        return xp
+
+    def practices_between(self: PracticeStore, name: str, start: datetime.datetime, end: datetime.datetime) -> list[tuple[str, int, datetime.datetime]]:
+        rows = self.db.execute(
+            '''SELECT p.desc, p.xp, p.ts
+               FROM practices p JOIN students s ON s.id = p.student_id
+               WHERE s.name = ? AND p.ts BETWEEN ? AND ?
+               ORDER BY p.ts''',
+            (name, start.isoformat(' '), end.isoformat(' '))
+        )
+
+        return [(desc, xp, datetime.datetime.fromisoformat(ts)) for (desc, xp, ts) in rows]
+
+    def get_xp_matrix(self: PracticeStore, students: list[Student], weeks: list[tuple[datetime.date]]) -> np.ndarray:
+        """
+        Weeks are whole days, from the start of the first to the end of the last.
+        """
+        import numpy as np
+
+        matrix = np.zeros((len(students), len(weeks)), dtype=np.int64)
+        ids = dict(self.db.execute('SELECT name, id FROM students'))
+        rows = {ids[stu.name]: i for (i, stu) in enumerate(students)}
+
+        with self.db:
+            # stop is the day after the week, as ts has a time too
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS weeks (i INTEGER PRIMARY KEY, start TEXT, stop TEXT)')
+            self.db.execute('DELETE FROM weeks')
+            self.db.executemany(
+                'INSERT INTO weeks VALUES (?, ?, ?)',
+                ((i, s.isoformat(), (e + datetime.timedelta(days=1)).isoformat()) for (i, (s, e)) in enumerate(weeks))
+            )
+
+            totals = self.db.execute(
+                '''SELECT p.student_id, w.i, SUM(p.xp)
+                   FROM weeks w JOIN practices p ON p.ts >= w.start AND p.ts < w.stop
+                   WHERE p.student_id IS NOT NULL
+                   GROUP BY p.student_id, w.i'''
+            )
+
+            for (student_id, col, xp) in totals:
+                if student_id in rows:
+                    matrix[rows[student_id], col] = xp
+
+        return matrix
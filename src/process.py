@@ -9,25 +9,57 @@
 
 from __future__ import annotations
 import datetime as datetime
+import functools
+import sys
 from pathlib import Path
-from typing import TextIO
+from typing import Callable, Iterable, TextIO, TYPE_CHECKING
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 import csv
-import openpyxl
-from openpyxl.styles import Font, PatternFill
+from aliases import AliasCache, AliasIndex, normalize
+from parse_cache import ParseCache, hash_file
+from profiling import profiler
+from week_cache import WeekCache, WeekFiles
+from weeks import WeekCalendar, get_dt_bounds
+from export import MarkingTable, export_table, FORMATS
+from render import Column
+import render
+import watch
+
+# NumPy, openpyxl and the rest are imported where they're used, so that the
+# text reports start about as fast as Python itself (see benchmark.py --startup)
+if TYPE_CHECKING:
+    from openpyxl.cell import Cell
+    from openpyxl.worksheet.dimensions import ColumnDimension
+    import numpy as np
+    from openpyxl.styles import NamedStyle
+    from openpyxl.cell import WriteOnlyCell
+    from practice_store import PracticeStore
 
 PATH_BASE = Path(__file__).parent
 PATH_CONFIG = PATH_BASE / 'config'
 PATH_INPUT = PATH_BASE / 'input'
 PATH_OUTPUT = PATH_BASE / 'output'
 PATH_TEMPLATES = PATH_BASE / 'templates'
+PATH_CACHE = PATH_BASE / 'cache' / 'process.pickle'
+PATH_STORE = PATH_BASE / 'data' / 'practices.sqlite3'
+PATH_WEEKS = PATH_BASE / 'cache' / 'weeks.pickle'
+PATH_ALIASES = PATH_BASE / 'cache' / 'aliases.json'
 
 PATH_VARIABLES = PATH_CONFIG / 'variables.txt'
 PATH_TEMPLATE_FINAL_REPORT = PATH_TEMPLATES / 'final_report.xlsx'
 
+# The text reports' tables
+WEEK_COLUMNS = [Column('Name', 20), Column('XP', 4), Column('Counted', 3)]
+STUDENT_COLUMNS = [Column('Week'), Column('XP')]
+
 FMT_DT_INPUT = '%Y-%m-%d %H-%M'
 FMT_DT_OUTPUT = '%Y-%m-%d %H-%M'
 FMT_DATE_OUTPUT = '%Y-%m-%d (%a)'
 
+DAY_MICROSECONDS = 86_400 * 1_000_000
+
 PLACEHOLDER_SKIP = '-'
 NUMBER_BONUS = '--'
 
@@ -35,21 +67,105 @@ WEIGHT_XP = 1
 WEIGHT_CONSISTENCY = 1
 MAX_BONUS = 120
 
+# Keep practices in a SQLite file under data/ rather than reparsing input/ each run
+USE_STORE = False
+
+# Processes for reading input files; 0 for one per core
+WORKERS = 1
+
+# Time each stage and write output/trace.json
+PROFILE = False
+
+# What the export report writes: any of csv, jsonl and parquet (which needs pyarrow)
+EXPORT_FORMATS = ['csv', 'jsonl']
+
+# (dates seen, [(alias, desc, xp, dt), ...])
+ParsedFile = tuple[list[datetime.date], list[tuple[str, str, int, datetime.datetime]]]
+
+# Every desc seen, once, so that a practice only keeps its number here
+DESCS: list[str] = []
+DESC_IDS: dict[str, int] = {}
+
 # Classes
 
 class Student:
+    """
+    Practices are kept column by column, one row each: the time as dt_key, the XP,
+    the desc's number in DESCS and the number of the file it came from.
+    A Practice is only made when something asks for one.
+    """
     name: str
-    practices: set[Practice]
+    times: array
+    xps: array
+    descs: array
+    files: array
+    cumulative_xp: array
+    indexed: bool
+    store: PracticeStore | None
 
     def __init__(self: Student, name: str) -> None:
         self.name = name
-        self.practices = set()
+        self.times = array('q')
+        self.xps = array('q')
+        self.descs = array('I')
+        self.files = array('I')
+        self.cumulative_xp = array('q', [0])
+        self.indexed = True
+        self.store = None
+
+    def add_practice(self: Student, desc: str, xp: int, dt: datetime.datetime, file: int) -> None:
+        self.times.append(dt_key(dt))
+        self.xps.append(xp)
+        self.descs.append(get_desc_id(desc))
+        self.files.append(file)
+        self.indexed = False
+
+    def remove_file(self: Student, file: int) -> None:
+        if file in self.files:
+            self.reorder([i for (i, f) in enumerate(self.files) if f != file])
+            self.indexed = False
+
+    def reorder(self: Student, rows: list[int]) -> None:
+        self.times = array('q', [self.times[i] for i in rows])
+        self.xps = array('q', [self.xps[i] for i in rows])
+        self.descs = array('I', [self.descs[i] for i in rows])
+        self.files = array('I', [self.files[i] for i in rows])
+
+    def build_index(self: Student) -> None:
+        # Sorted by time, with a running XP total, so that a range is two bisects.
+        # Plain int64 arrays keep this small and can be handed to NumPy as they are.
+        self.reorder(sorted(range(len(self.times)), key=self.times.__getitem__))
+        self.cumulative_xp = array('q', accumulate(self.xps, initial=0))
+        self.indexed = True
+
+    def practice(self: Student, i: int) -> Practice:
+        return Practice(self, DESCS[self.descs[i]], self.xps[i], key_dt(self.times[i]))
+
+    def bounds_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> tuple[int, int]:
+        if not self.indexed:
+            self.build_index()
+
+        lo = bisect_left(self.times, dt_key(start))
+        hi = bisect_right(self.times, dt_key(end))
+        return lo, max(lo, hi)
 
     def practices_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> set[Practice]:
-        return set(filter(lambda p: p.is_between(start, end), self.practices))
+        profiler.count('range queries')
+
+        if self.store is not None:
+            return set(Practice(self, desc, xp, dt) for (desc, xp, dt) in self.store.practices_between(self.name, start, end))
+
+        lo, hi = self.bounds_between(start, end)
+        return set(map(self.practice, range(lo, hi)))
     
     def xp_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> int:
-        return sum(p.xp for p in self.practices_between(start, end))
+        profiler.count('range queries')
+
+        if self.store is not None:
+            return self.store.xp_between(self.name, start, end)
+
+        lo, hi = self.bounds_between(start, end)
+        return self.cumulative_xp[hi] - self.cumulative_xp[lo]
 
     def __hash__(self: Student) -> int:
         return hash(self.name)
@@ -58,6 +174,9 @@ class Student:
         return self.name
 
 class Practice:
+    # Slotted, with one shared copy of each desc, as there are a great many of these
+    __slots__ = ('student', 'desc', 'xp', 'date')
+
     student: Student
     desc: str
     xp: int
@@ -65,7 +184,7 @@ class Practice:
 
     def __init__(self: Practice, student: Student, desc: str, xp: int, date: datetime.datetime) -> None:
         self.student = student
-        self.desc = desc
+        self.desc = sys.intern(desc)
         self.xp = xp
         self.date = date
 
@@ -73,29 +192,122 @@ class Practice:
         return start <= self.date <= end
 
     def __hash__(self: Practice) -> int:
-        return hash((self.student, self.desc, self.xp, self.date.strftime(FMT_DT_OUTPUT)))
+        # To the minute, like FMT_DT_OUTPUT, without formatting a string
+        d = self.date
+        return hash((self.student, self.desc, self.xp, d.toordinal(), d.hour, d.minute))
     
     def __repr__(self: Practice) -> str:
         return f'{self.student} : {self.xp} @ {self.date.strftime(FMT_DT_OUTPUT)}'
 
+class ReportTemplate:
+    """
+    What the final report takes from its template: the sheet, its theme, its columns,
+    the heading rows as they are, and the styles of the first row below them for the students.
+    The totals and averages are filled in where they have always gone, B2 to H3.
+    """
+    title: str
+    theme: bytes | None
+    columns: list[ColumnDimension]
+    headings: list[list[Cell]]
+    body: list[Cell]
+
+    def __init__(self: ReportTemplate, path: Path) -> None:
+        import openpyxl
+
+        # Only a few rows, so a normal load, which also has the column widths, is cheap
+        wb = openpyxl.load_workbook(path)
+        ws = wb.active
+
+        # The headings run to the last row with anything written in it; the row after can be styled for the students
+        rows = [list(row) for row in ws.iter_rows(max_row=ws.max_row + 1, max_col=ws.max_column)]
+        n = max((i + 1 for (i, row) in enumerate(rows) if any(cell.value is not None for cell in row)), default=0)
+
+        self.title = ws.title
+        self.theme = wb.loaded_theme
+        self.columns = list(ws.column_dimensions.values())
+        self.headings = rows[:n]
+        self.body = rows[n]
+
+    def make_styles(self: ReportTemplate) -> list[NamedStyle]:
+        """
+        'report body A' and so on for the student rows, and 'report name' for their names.
+        """
+        from openpyxl.styles import Font, NamedStyle, PatternFill
+
+        styles = [NamedStyle(f'report body {cell.column_letter}', **copy_style(cell)) for cell in self.body]
+        styles.append(NamedStyle('report name', font=Font(color='ffffff'), fill=PatternFill('solid', fgColor='153d64')))
+        return styles
+
+    def apply_columns(self: ReportTemplate, ws: object) -> None:
+        for dim in self.columns:
+            target = ws.column_dimensions[dim.index]
+            target.min, target.max, target.width = dim.min, dim.max, dim.width
+
+            if dim.has_style:
+                for (attr, value) in copy_style(dim).items():
+                    setattr(target, attr, value)
+
 class DuolingoMarker:
     students: dict[str, Student]
     aliases: dict[str, Student]
     skips: set[str]
+    resolved: dict[str, Student | None]
+    interactive: bool
     goal: int
     bonus_weeks: set[datetime.date]
     dates: set[datetime.date]
+    calendar: WeekCalendar | None
+    files: dict[str, tuple[str, datetime.date, datetime.date]]
+    file_ids: dict[str, int]
+    next_file_id: int
+    store: PracticeStore | None
+    path_variables: Path
+    path_input: Path
+    path_output: Path
+    path_cache: Path
+    path_store: Path
+    path_weeks: Path
+    path_aliases: Path
+
+    def __init__(self: DuolingoMarker, root: Path | None=None) -> None:
+        """
+        By default everything lives beside this script. A classroom root instead holds
+        its own variables.txt, input/ and output/, with its cache and store alongside.
+        """
+        if root is None:
+            self.path_variables = PATH_VARIABLES
+            self.path_input = PATH_INPUT
+            self.path_output = PATH_OUTPUT
+            self.path_cache = PATH_CACHE
+            self.path_store = PATH_STORE
+            self.path_weeks = PATH_WEEKS
+            self.path_aliases = PATH_ALIASES
+        else:
+            self.path_variables = root / 'variables.txt'
+            self.path_input = root / 'input'
+            self.path_output = root / 'output'
+            self.path_cache = root / 'cache' / 'process.pickle'
+            self.path_store = root / 'data' / 'practices.sqlite3'
+            self.path_weeks = root / 'cache' / 'weeks.pickle'
+            self.path_aliases = root / 'cache' / 'aliases.json'
 
-    def __init__(self: DuolingoMarker) -> None:
         self.students = {}
         self.aliases = {}
         self.skips = set()
+        self.resolved = {}
+        self.interactive = False
         self.goal: 0
         self.bonus_weeks = set()
         self.dates = set()
+        self.calendar = None
+        self.files = {}
+        self.file_ids = {}
+        self.next_file_id = 0
+        self.store = None
 
+    @profiler.timed('parse_variables')
     def parse_variables(self: DuolingoMarker):
-        with open(PATH_VARIABLES, 'r') as f:
+        with open(self.path_variables, 'r') as f:
             lines = list(filter(lambda L: L and not L.startswith(';'), map(str.strip, f.readlines())))
 
             for line in lines:
@@ -112,6 +324,7 @@ class DuolingoMarker:
                 elif k == 'alias':
 
                     alias, real = map(lambda s: s.strip().lower(), v.split('=='))
+                    alias = normalize(alias)
 
                     if not real:
                         real = alias
@@ -123,43 +336,238 @@ class DuolingoMarker:
                     s = self.students.setdefault(real, Student(real))
                     self.aliases[alias] = s
 
-    def parse_input_files(self: DuolingoMarker) -> None:        
-        paths = PATH_INPUT.glob('*.csv')
-        for path in paths:
-            if path.stem.startswith('_'):
+        self.load_confirmed_aliases()
+
+    def load_confirmed_aliases(self: DuolingoMarker) -> None:
+        """
+        Usernames matched to students on earlier runs. variables.txt wins if they disagree.
+        """
+        cache = AliasCache(self.path_aliases)
+        cache.load()
+
+        for (alias, real) in cache.confirmed.items():
+            if alias in self.aliases or alias in self.skips:
                 continue
 
-            self.parse_input_file(path)
+            if real == PLACEHOLDER_SKIP:
+                self.skips.add(alias)
+            elif real in self.students:
+                self.aliases[alias] = self.students[real]
 
+    def attach_store(self: DuolingoMarker, store: PracticeStore) -> None:
+        """
+        Keep practices in SQLite instead of memory. Call after parse_variables.
+        """
+        self.store = store
+        store.sync_variables(self)
+
+        for stu in self.students.values():
+            stu.store = store
+
+    @profiler.timed('parse_input_files')
+    def parse_input_files(self: DuolingoMarker, use_cache: bool=True, workers: int=WORKERS) -> None:
+        paths = self.get_input_paths()
+
+        if self.store is not None:
+            self.store.ingest_files(paths, lambda ps: read_input_files(ps, workers))
+
+            unknown = self.store.get_unknown_aliases()
+            if unknown:
+                self.resolve_unknown_aliases(unknown)
+                self.store.sync_variables(self)
+
+            self.dates = self.store.get_dates()
+            self.calendar = None
+            self.files = self.store.get_files()
+            return
+
+        cache, parsed = self.check_input_files(paths, use_cache)
+        missing = [path for path in paths if parsed[path] is None]
+
+        for (path, result) in zip(missing, read_input_files(missing, workers)):
+            parsed[path] = result
+            cache.put(path, result)
+
+        self.ingest_input_files(cache, parsed, use_cache)
+
+    def check_input_files(self: DuolingoMarker, paths: list[Path], use_cache: bool=True) -> tuple[ParseCache, dict[Path, ParsedFile | None]]:
+        """
+        The first half of parse_input_files: each file's cached contents, or None if it has to be read.
+        """
+        cache = ParseCache(self.path_cache)
+        if use_cache:
+            cache.load()
+
+        parsed = {path: cache.get(path) for path in paths}
+        missing = sum(result is None for result in parsed.values())
+
+        profiler.count('files cached', len(paths) - missing)
+        profiler.count('files read', missing)
+        return cache, parsed
+
+    def ingest_input_files(self: DuolingoMarker, cache: ParseCache, parsed: dict[Path, ParsedFile], use_cache: bool=True) -> None:
+        """
+        The second half of parse_input_files, once every file has been read and put in the cache.
+        """
+        paths = list(parsed)
+
+        # Every unknown username in every file at once, before any is ingested
+        unknown = self.find_unknown_aliases(parsed.values())
+        if unknown:
+            self.resolve_unknown_aliases(unknown)
+
+        # Always in path order, however the files were read
+        for path in paths:
+            key = str(path.resolve())
+
+            with profiler.stage('ingest', file=path.name):
+                self.ingest(parsed[path], self.get_file_id(key))
+
+            dates = parsed[path][0]
+            self.files[key] = (cache.digest(path), min(dates), max(dates))
+
+        if use_cache:
+            cache.evict_unseen()
+            cache.save()
+
+    def get_input_paths(self: DuolingoMarker) -> list[Path]:
+        return sorted(p for p in self.path_input.glob('*.csv') if not p.stem.startswith('_'))
+
+    @profiler.timed('parse_input_file')
     def parse_input_file(self: DuolingoMarker, path: Path) -> None:
+        """
+        Bring one new, changed or deleted file up to date without touching the others.
+        """
+        key = str(path.resolve())
+        exists = path.exists()
 
-        ts_start, ts_end = path.stem.split()
-        dt_start = datetime.datetime.strptime(f'{ts_start} 00-00', FMT_DT_INPUT)
-        dt_end = datetime.datetime.strptime(f'{ts_end} 11-59', FMT_DT_INPUT)
+        # All the reading first, so a half-saved file that fails leaves the old contents in place
+        if exists:
+            parsed = read_input_file(path)
+            dates = parsed[0]
+            entry = (hash_file(path), min(dates), max(dates))
 
-        self.dates.add(datetime.date(dt_start.year, dt_start.month, dt_start.day))
-        self.dates.add(datetime.date(dt_end.year, dt_end.month, dt_end.day))
+            unknown = self.find_unknown_aliases([parsed])
+            if unknown:
+                self.resolve_unknown_aliases(unknown)
 
-        with open(path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader)
+        # Rare enough, as only watch does it, to look through every student rather than keep track
+        if key in self.file_ids:
+            file = self.file_ids.pop(key)
+            for student in self.students.values():
+                student.remove_file(file)
 
-            for row in reader:
-                # Name, Username, Email, ..., ..., ..., ..., ..., ..., Total XP, ...rest
+        self.files.pop(key, None)
 
-                alias = row[1]
-                xp = int(row[10])
-                dt = dt_start
+        if exists:
+            self.ingest(parsed, self.get_file_id(key))
+            self.files[key] = entry
 
-                if alias.lower() in self.skips:
-                    continue
-                
-                student = self.aliases[alias.lower()]
-                desc = f'Main panel week summary {ts_start} to {ts_end}'
+        # Each export covers exactly its first and last dates
+        self.dates = set(d for (_, first, last) in self.files.values() for d in (first, last))
+        self.calendar = None
+
+    def get_file_id(self: DuolingoMarker, key: str) -> int:
+        """
+        A new number each time a file is ingested, so one that was removed is never mixed up with its old practices.
+        """
+        if key not in self.file_ids:
+            self.file_ids[key] = self.next_file_id
+            self.next_file_id += 1
+
+        return self.file_ids[key]
+
+    def ingest(self: DuolingoMarker, parsed: ParsedFile, file: int) -> None:
+        dates, records = parsed
+        practices = []
+
+        # Resolve everything first, so an unknown username leaves nothing half-added
+        for (alias, desc, xp, dt) in records:
+            student = self.resolve_alias(alias)
+            if student is None:
+                continue
 
-                practice = Practice(student, desc, xp, dt)
-                student.practices.add(practice)
+            practices.append((student, desc, xp, dt))
+
+        self.dates.update(dates)
+        self.calendar = None
+
+        for (student, desc, xp, dt) in practices:
+            student.add_practice(desc, xp, dt, file)
+
+        profiler.count('rows parsed', len(records))
+        profiler.count('practices created', len(practices))
  
+    def resolve_alias(self: DuolingoMarker, alias: str) -> Student | None:
+        """
+        None for a skipped username, KeyError for an unknown one.
+        Each spelling is only normalized the first time it's seen.
+        """
+        try:
+            return self.resolved[alias]
+        except KeyError:
+            pass
+
+        key = normalize(alias)
+        student = None if key in self.skips else self.aliases[key]
+
+        self.resolved[alias] = student
+        return student
+
+    def find_unknown_aliases(self: DuolingoMarker, parsed: Iterable[ParsedFile]) -> dict[str, int]:
+        """
+        Rows per unknown username.
+        """
+        unknown = {}
+
+        for (_, records) in parsed:
+            for record in records:
+                try:
+                    self.resolve_alias(record[0])
+                except KeyError:
+                    key = normalize(record[0])
+                    unknown[key] = unknown.get(key, 0) + 1
+
+        return unknown
+
+    @profiler.timed('resolve_unknown_aliases')
+    def resolve_unknown_aliases(self: DuolingoMarker, unknown: dict[str, int]) -> None:
+        """
+        Suggest a student for each unknown username. Interactively, the choice is kept for
+        next time; otherwise the username's rows are left out of this run.
+        """
+        names = {alias: stu.name for (alias, stu) in self.aliases.items()}
+        names.update((name, name) for name in self.students)
+        index = AliasIndex(names)
+
+        cache = AliasCache(self.path_aliases)
+        cache.load()
+        left_out = False
+
+        for (alias, rows) in sorted(unknown.items()):
+            suggestions = index.suggest(alias)
+            real = pick_alias(self, alias, rows, suggestions) if self.interactive else None
+
+            if real is None:
+                maybe = f' (maybe {", ".join(suggestions)}?)' if suggestions else ''
+                print(f'Left out {rows} row(s) for unknown username {alias}{maybe}')
+
+                # Only for this run
+                self.skips.add(alias)
+                left_out = True
+                continue
+
+            cache.confirm(alias, real)
+            if real == PLACEHOLDER_SKIP:
+                self.skips.add(alias)
+            else:
+                self.aliases[alias] = self.students[real]
+
+        cache.save()
+
+        if left_out and not self.interactive:
+            print(f'Add them to {self.path_variables.name}, or run interactively to match them to students')
+
     def show_weeks(self: DuolingoMarker) -> None:
         weeks = self.get_weeks()
         if not weeks:
@@ -167,12 +575,13 @@ class DuolingoMarker:
             return
         
         numbers = self.get_week_numbers(weeks)
+        students = self.get_sorted_students()
 
         for i in range(1, len(weeks) + 1):
             week = weeks[-i]
             number = numbers[-i]
             print()
-            print(self.format_week(*week, number))
+            print(self.format_week(*week, number, students=students))
 
             if i < len(weeks):
                 choice = input('\nEnter to show another week or Q to quit: ').strip().upper()
@@ -182,77 +591,90 @@ class DuolingoMarker:
         
         print('\nFinished')
 
+    def get_calendar(self: DuolingoMarker) -> WeekCalendar:
+        """
+        Built once, and again only if the dates change.
+        """
+        if self.calendar is None:
+            with profiler.stage('build calendar'):
+                self.calendar = WeekCalendar(self.dates, self.bonus_weeks, NUMBER_BONUS)
+
+        return self.calendar
+
     def get_weeks(self: DuolingoMarker) -> list[tuple[datetime.date]]:
         if not self.dates:
             return
-        
-        weeks = []
 
-        start = None
+        return self.get_calendar().weeks
+    
+    def get_sorted_students(self: DuolingoMarker) -> list[Student]:
+        return sorted(self.students.values(), key=lambda s: s.name)
 
-        for date in sorted(self.dates):
+    def get_week_numbers(self: DuolingoMarker, weeks: list[tuple[datetime.date]]) -> list[str]:
+        calendar = self.get_calendar()
+        return [calendar.label_of(start) for (start, _) in weeks]
 
-            # Started week?
-            if start is None:
-                start = date
-                end = None
+    def format_week(self: DuolingoMarker, start: datetime.date, end: datetime.date, label: str='', xps: list[int] | None=None, students: list[Student] | None=None) -> str:
+        return render.to_string(lambda sink: self.render_week(sink, start, end, label, xps, students))
 
-            # Sunday?
-            if date.strftime('%w') == '0':
-                end = date
-                weeks.append((start, end))
-                start = None
-        
-        # Didn't end on a Sunday?
-        if end is None:
-            end = date
-            weeks.append((start, end))
+    @profiler.timed('render_week')
+    def render_week(self: DuolingoMarker, sink: render.Sink, start: datetime.date, end: datetime.date, label: str='', xps: list[int] | None=None, students: list[Student] | None=None) -> None:
+        """
+        students is everyone sorted by name, which callers rendering many weeks sort once. xps, if already known, follows it.
+        """
+        if students is None:
+            students = self.get_sorted_students()
 
-        return weeks
-    
-    def get_week_numbers(self: DuolingoMarker, weeks: list[tuple[datetime.date]]) -> list[str]:
-        n = 1
-        numbers = []
+        if xps is None:
+            start_dt, end_dt = get_dt_bounds(start, end)
+            xps = [stu.xp_between(start_dt, end_dt) for stu in students]
 
-        boni = self.bonus_weeks.copy()
+        if label:
+            label += ' '
 
-        for (start, end) in weeks:
-            for bonus in boni:
-                if start <= bonus <= end:
-                    numbers.append(NUMBER_BONUS)
-                    boni.remove(bonus)
-                    break
+        sink.heading(f'Week {label}: {start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}')
+        sink.table(WEEK_COLUMNS, ((stu.name.title(), xp, min(self.goal, xp)) for (stu, xp) in zip(students, xps)))
 
-            else:
-                numbers.append(f'{n:>2}')
-                n += 1
-        
-        return numbers
+    def format_student_weeks(self: DuolingoMarker, stu: Student, weeks: list[tuple[datetime.date]], numbers: list[str], xps: list[int] | None=None) -> str:
+        return render.to_string(lambda sink: self.render_student_weeks(sink, stu, weeks, numbers, xps))
 
-    def format_week(self: DuolingoMarker, start: datetime.date, end: datetime.date, label: str='') -> None:
-        start_dt = date_to_dt(start)
-        end_dt = date_to_dt(end)
+    @profiler.timed('render_student_weeks')
+    def render_student_weeks(self: DuolingoMarker, sink: render.Sink, stu: Student, weeks: list[tuple[datetime.date]], numbers: list[str], xps: list[int] | None=None) -> None:
+        """
+        Newest week first. xps, if already known, follows weeks.
+        """
+        if xps is None:
+            xps = [stu.xp_between(*get_dt_bounds(start, end)) for (start, end) in weeks]
 
-        if label:
-            label += ' '
+        rows = (
+            (f'{number} {start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}', xp)
+            for ((start, end), number, xp) in reversed(list(zip(weeks, numbers, xps)))
+        )
+        sink.table(STUDENT_COLUMNS, rows, title=str(stu), header=False, sep=': ')
 
-        s = f'Week {label}: {start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}'
+    @profiler.timed('save_student_reports')
+    def save_student_reports(self: DuolingoMarker, students: list[Student], weeks: list[tuple[datetime.date]], numbers: list[str], histories: dict[str, list[int]], directory: Path) -> None:
+        """
+        A workbook per student, newest week first like format_student_weeks. histories follows weeks.
+        """
+        import openpyxl
 
-        s += "\n\nName".ljust(22) + ' : ' + "XP   : Counted\n"
-        s += "=" * 37
+        directory.mkdir(parents=True, exist_ok=True)
 
-        for stu in sorted(self.students.values(), key=lambda s: s.name):
-            xp = stu.xp_between(start_dt, end_dt)
+        for stu in students:
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet('Weeks')
+            ws.append(['Week', 'Start', 'End', 'XP', 'Counted'])
 
-            name = stu.name.title().ljust(20)
-            full = str(xp).ljust(4)
-            capt = str(min(self.goal, xp)).ljust(3)
+            for ((start, end), number, xp) in reversed(list(zip(weeks, numbers, histories[stu.name]))):
+                ws.append([number.strip(), start, end, xp, min(self.goal, xp)])
 
-            s += '\n' + ' : '.join([name, full, capt])
-        
-        return s
-    
-    def calculate_final_report(self: DuolingoMarker) -> dict[str]:
+            wb.save(directory / f'student {stu.name}.xlsx')
+
+        print(f'Saved {len(students)} student report(s) to {directory}')
+
+    @profiler.timed('calculate_final_report')
+    def calculate_final_report(self: DuolingoMarker, use_cache: bool=True) -> dict[str]:
         report = {
             'totals': {
                 'xp': 0,
@@ -269,29 +691,207 @@ class DuolingoMarker:
             'students': {}
         }
 
-        weeks = self.get_weeks()
-        numbers = self.get_week_numbers(weeks)
+        calendar = self.get_calendar()
 
-        report['totals']['weeks'] = sum(n is not NUMBER_BONUS for n in numbers)
+        report['totals']['weeks'] = calendar.count_required()
         report['totals']['xp'] = self.goal * report['totals']['weeks']
 
-        # Convert week dates to dts for practice comparisons...
-        # Can't be done earlier because bonus uses dates...
-        # TODO reconcile
-        weeks = list((date_to_dt(s), date_to_dt(e)) for (s, e) in weeks)
+        students = list(self.students.values())
+        if not students:
+            raise ValueError('No students to mark')
 
-        for stu in self.students.values():
-            xps = []
-            for (start_d, end_d) in weeks:
-                xps.append(stu.xp_between(start_d, end_d))
-            
-            report['students'][stu.name] = self.get_student_stats(report['totals']['weeks'], xps)
+        matrix = self.get_cached_xp_matrix(students, calendar, use_cache)
+        columns = self.get_class_stats(report['totals']['weeks'], matrix)
 
-        n = len(self.students)
         for key in report['averages']:
-            report['averages'][key] = round(sum(s[key] for s in report['students'].values()) / n)
+            report['averages'][key] = round(columns[key].sum() / len(students))
+
+        columns = {k: v.tolist() for (k, v) in columns.items()}
+
+        for (i, stu) in enumerate(students):
+            d = {k: v[i] for (k, v) in columns.items()}
+            d['xp comment'] = self.format_xp_comment(report['totals']['weeks'], d['total xp'], d['weekly xp'])
+            d['consistency comment'] = self.format_consistency_comment(report['totals']['weeks'], d['100% weeks'], d['50% weeks'])
+            report['students'][stu.name] = d
 
         return report
+
+    @profiler.timed('get_marking_table')
+    def get_marking_table(self: DuolingoMarker) -> MarkingTable:
+        """
+        The whole student x week matrix with every student's stats, for export.
+        """
+        calendar = self.get_calendar()
+
+        students = list(self.students.values())
+        matrix = self.get_cached_xp_matrix(students, calendar)
+        stats = self.get_class_stats(calendar.count_required(), matrix)
+
+        # Sorted by name like the other reports, after the cache has seen its usual row order
+        order = sorted(range(len(students)), key=lambda i: students[i].name)
+        stats = {k: v[order] for (k, v) in stats.items()}
+
+        return MarkingTable([students[i].name for i in order], calendar.weeks, calendar.numbers, self.goal, matrix[order], stats)
+
+    @profiler.timed('export_marks')
+    def export_marks(self: DuolingoMarker, formats: list[str]=EXPORT_FORMATS) -> None:
+        table = self.get_marking_table()
+
+        for fmt in formats:
+            try:
+                paths = export_table(table, self.path_output, fmt, NUMBER_BONUS)
+            except RuntimeError as e:
+                print(f'Could not export {fmt}')
+                print(e)
+                continue
+
+            for path in paths:
+                print(f'Saved export to {path}')
+
+    @profiler.timed('get_cached_xp_matrix')
+    def get_cached_xp_matrix(self: DuolingoMarker, students: list[Student], calendar: WeekCalendar, use_cache: bool=True) -> np.ndarray:
+        """
+        get_xp_matrix, only recomputing the weeks whose input files have changed since the last run.
+        """
+        import numpy as np
+
+        weeks = calendar.weeks
+        cache = WeekCache(self.path_weeks, self.get_roster(students))
+        if use_cache:
+            cache.load()
+
+        matrix = np.zeros((len(students), len(weeks)), dtype=np.int64)
+        files = [self.get_week_files(start, end) for (start, end) in weeks]
+        missing = []
+
+        for (i, week) in enumerate(weeks):
+            xps = cache.get(week, files[i])
+            if xps is None:
+                missing.append(i)
+            else:
+                matrix[:, i] = xps
+
+        profiler.count('weeks cached', len(weeks) - len(missing))
+        profiler.count('weeks computed', len(missing))
+
+        if missing:
+            columns = self.get_xp_matrix(students, calendar, missing)
+
+            for (j, i) in enumerate(missing):
+                matrix[:, i] = columns[:, j]
+                cache.put(weeks[i], files[i], columns[:, j].copy())
+
+        if use_cache:
+            cache.evict_unseen()
+            cache.save()
+
+        return matrix
+
+    def get_roster(self: DuolingoMarker, students: list[Student]) -> tuple:
+        return (
+            tuple(stu.name for stu in students),
+            tuple(sorted((alias, stu.name) for (alias, stu) in self.aliases.items())),
+        )
+
+    def get_week_files(self: DuolingoMarker, start: datetime.date, end: datetime.date) -> WeekFiles:
+        return tuple(sorted(
+            (key, digest) for (key, (digest, first, last)) in self.files.items()
+            if first <= end and start <= last
+        ))
+
+    @profiler.timed('get_xp_matrix')
+    def get_xp_matrix(self: DuolingoMarker, students: list[Student], calendar: WeekCalendar, wanted: list[int] | None=None) -> np.ndarray:
+        """
+        Sum every practice into a students x weeks matrix in one pass.
+        wanted picks and orders the calendar's weeks; by default it's all of them.
+        """
+        if wanted is None:
+            wanted = list(range(len(calendar)))
+
+        if self.store is not None:
+            return self.store.get_xp_matrix(students, [calendar.weeks[i] for i in wanted])
+
+        import numpy as np
+
+        matrix = np.zeros((len(students), len(wanted)), dtype=np.int64)
+        if not wanted:
+            return matrix
+
+        # Each student's time index already has everything, in int64,
+        # so gather it into one flat array per field before NumPy sees it
+        times = array('q')
+        cumulative_xp = array('q')
+
+        for stu in students:
+            if not stu.indexed:
+                stu.build_index()
+
+            times.extend(stu.times)
+            cumulative_xp.extend(stu.cumulative_xp)
+
+        counts = np.array([len(stu.times) for stu in students], dtype=np.int64)
+        rows = np.repeat(np.arange(len(students)), counts)
+        times = np.frombuffer(times, dtype=np.int64)
+
+        # Every running total starts again at 0, so drop the steps between students
+        steps = np.diff(np.frombuffer(cumulative_xp, dtype=np.int64))
+        keep = np.ones(len(steps), dtype=bool)
+        keep[np.cumsum(counts + 1)[:-1] - 1] = False
+        xps = steps[keep]
+
+        # The calendar's week for each practice's day (dt_key counts days from the same
+        # day 1 as toordinal), then that week's column, or -1 for days outside them
+        days = times // DAY_MICROSECONDS - calendar.first
+        inside = (days >= 0) & (days < len(calendar.days))
+        weeks = np.full(len(times), -1, dtype=np.int64)
+        weeks[inside] = np.frombuffer(calendar.days, dtype=np.int64)[days[inside]]
+
+        # With a spare -1 on the end for the days outside every week
+        columns = np.full(len(calendar) + 1, -1, dtype=np.int64)
+        columns[wanted] = np.arange(len(wanted))
+        cols = columns[weeks]
+        found = cols >= 0
+
+        np.add.at(matrix, (rows[found], cols[found]), xps[found])
+        return matrix
+
+    @profiler.timed('get_class_stats')
+    def get_class_stats(self: DuolingoMarker, wks: int, matrix: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        The same arithmetic as get_student_stats, one column per stat, without the comments.
+        """
+        import numpy as np
+
+        # NumPy would make NaN of this rather than fail, and NaN cast to int64 looks like a mark
+        if not wks:
+            raise ValueError('No data found: there are no required weeks to mark')
+
+        d = {}
+
+        # Bases
+        xp_goal = self.goal * wks
+        xp = matrix.sum(axis=1)
+
+        # Stats
+        d['total xp'] = xp
+        d['weekly xp'] = np.round(xp / wks).astype(np.int64)
+        d['100% weeks'] = (matrix >= self.goal).sum(axis=1)
+        d['50% weeks'] = (matrix >= (self.goal / 2)).sum(axis=1) - d['100% weeks']
+
+        # Marks
+        d['xp mark'] = np.minimum(
+            MAX_BONUS / 100,
+            np.minimum(xp / xp_goal, 1) + (np.maximum(xp, xp_goal) - xp_goal) / (self.goal * 100)
+        )
+        d['xp mark'] = np.round(100 * d['xp mark']).astype(np.int64)
+
+        d['consistency mark'] = np.minimum(
+            MAX_BONUS / 100,
+            (d['100% weeks'] / wks) + ((d['50% weeks'] / wks) / 2)
+        )
+        d['consistency mark'] = np.round(100 * d['consistency mark']).astype(np.int64)
+
+        return d
     
     def get_student_stats(self: DuolingoMarker, wks: int, xps: list[int]) -> dict[str, int]:
         """
@@ -325,11 +925,15 @@ class DuolingoMarker:
         d['consistency mark'] = round(100 * d['consistency mark'])
 
         # Comments
-        d['xp comment'] = f"Out of a goal of {xp_goal:,} XP, you earned {xp:,}. The weekly goal was {self.goal} and you earned an average of {d['weekly xp']} per week."
+        d['xp comment'] = self.format_xp_comment(wks, xp, d['weekly xp'])
         d['consistency comment'] = self.format_consistency_comment(wks, d['100% weeks'], d['50% weeks'])
 
         return d
     
+    def format_xp_comment(self: DuolingoMarker, wks: int, xp: int, weekly: int) -> str:
+        xp_goal = self.goal * wks
+        return f"Out of a goal of {xp_goal:,} XP, you earned {xp:,}. The weekly goal was {self.goal} and you earned an average of {weekly} per week."
+
     def format_consistency_comment(self: DuolingoMarker, n: int, full: int, half: int) -> str:
         s = ""
         s += f"We did {n} weeks of practice."
@@ -353,118 +957,234 @@ class DuolingoMarker:
 
         return s
     
-    def save_final_report(self: DuolingoMarker) -> None:
-        report = self.calculate_final_report()
+    @profiler.timed('save_final_report')
+    def save_final_report(self: DuolingoMarker, report: dict[str] | None=None) -> None:
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
 
-        # Workbook setup
-        wb = openpyxl.load_workbook(PATH_TEMPLATE_FINAL_REPORT)
-        ws = wb.active
-        fill_name = PatternFill('solid', fgColor='153d64')
-        font_name = Font(color='ffffff')
+        if report is None:
+            report = self.calculate_final_report()
 
-        # Totals
-        totals = report['totals']
-        ws['B2'] = totals['xp']
-        ws['D2'] = totals['weeks']
+        # Workbook setup: rows are streamed out, so it's built in the template's image
+        with profiler.stage('workbook load'):
+            template = get_report_template(PATH_TEMPLATE_FINAL_REPORT)
 
-        # Averages
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(template.title)
+        wb.loaded_theme = template.theme
+        template.apply_columns(ws)
+
+        for style in template.make_styles():
+            wb.add_named_style(style)
+
+        def make_cell(style: str, value: object) -> WriteOnlyCell:
+            cell = WriteOnlyCell(ws, value)
+            cell.style = style
+            return cell
+
+        # Where the template's totals and averages rows have always been filled in
+        totals = report['totals']
         avgs = report['averages']
-        ws['B3'] = avgs['total xp']
-        ws['C3'] = avgs['weekly xp']
-        ws['D3'] = avgs['100% weeks']
-        ws['E3'] = avgs['50% weeks']
-        ws['F3'] = avgs['xp mark']
-        ws['H3'] = avgs['consistency mark']
+        figures = {
+            'B2': totals['xp'], 'D2': totals['weeks'],
+            'B3': avgs['total xp'], 'C3': avgs['weekly xp'], 'D3': avgs['100% weeks'], 'E3': avgs['50% weeks'],
+            'F3': avgs['xp mark'], 'H3': avgs['consistency mark'],
+        }
+
+        for cells in template.headings:
+            ws.append([copy_cell(ws, cell, figures.get(cell.coordinate, cell.value)) for cell in cells])
+
+        body = [f'report body {cell.column_letter}' for cell in template.body[1:]]
 
         # Students
-        for (i, stu) in enumerate(sorted(self.students.values(), key=lambda s: s.name)):
+        for stu in self.get_sorted_students():
             data = report['students'][stu.name]
-            r = i + 4
-            
-            ws[f'A{r}'] = stu.name
-            ws[f'A{r}'].fill = fill_name
-            ws[f'A{r}'].font = font_name
-
-            ws[f'B{r}'] = data['total xp']
-            ws[f'C{r}'] = data['weekly xp']
-            ws[f'D{r}'] = data['100% weeks']
-            ws[f'E{r}'] = data['50% weeks']
-            ws[f'F{r}'] = data['xp mark']
-            ws[f'G{r}'] = data['xp comment']
-            ws[f'H{r}'] = data['consistency mark']
-            ws[f'I{r}'] = data['consistency comment']
+
+            values = [
+                data['total xp'], data['weekly xp'], data['100% weeks'], data['50% weeks'],
+                data['xp mark'], data['xp comment'], data['consistency mark'], data['consistency comment'],
+            ]
+            ws.append([make_cell('report name', stu.name)] + [make_cell(style, value) for (style, value) in zip(body, values)])
 
         try:
-            wb.save(PATH_OUTPUT / 'final_report.xlsx')
-            print(f'Saved report to {PATH_OUTPUT / "final_report.xlsx"}')
+            self.path_output.mkdir(parents=True, exist_ok=True)
+            with profiler.stage('workbook save'):
+                wb.save(self.path_output / 'final_report.xlsx')
+            print(f'Saved report to {self.path_output / "final_report.xlsx"}')
         except Exception as e:
             print('Could not save report')
             print(e)
 
-    def format_final_report(self: DuolingoMarker) -> str:
-        s = ""
+    def format_final_report(self: DuolingoMarker, report: dict[str] | None=None) -> str:
+        # It has always opened with a blank line
+        return '\n' + render.to_string(lambda sink: self.render_final_report(sink, report))
 
-        report = self.calculate_final_report()
-        name_fill = len(max(self.students, key=len))
+    @profiler.timed('render_final_report')
+    def render_final_report(self: DuolingoMarker, sink: render.Sink, report: dict[str] | None=None) -> None:
+        if report is None:
+            report = self.calculate_final_report()
 
         # Totals
         totals = report['totals']
-        s += '\nTOTALS\n'
-        s += f"\nXP goal:      {totals['xp']} ({round(totals['xp'] / totals['weeks'])} per week)"
-        s += f"\n# weeks goal: {totals['weeks']}"
+        sink.heading('TOTALS')
+        sink.fields([
+            ('XP goal:', f"{totals['xp']} ({round(totals['xp'] / totals['weeks'])} per week)"),
+            ('# weeks goal:', totals['weeks']),
+        ])
 
         # Averages
         averages = report['averages']
-        s += '\n\nAVERAGES\n'
+        sink.heading('AVERAGES')
+        sink.fields([
+            ('Total XP earned:', averages['total xp']),
+            ('Weekly XP earned:', averages['weekly xp']),
+            ('100% weeks:', averages['100% weeks']),
+            ('50% weeks:', averages['50% weeks']),
+            ('XP mark:', f"{averages['xp mark']}%"),
+            ('Consistency mark:', f"{averages['consistency mark']}%"),
+        ])
+
+        # Students, sorted once for all four lists
+        students = [(name, report['students'][name]) for name in sorted(self.students)]
+        name_fill = max(map(len, self.students))
+
+        sink.table(
+            [Column('Name', name_fill), Column('XP mark', 3, '>')],
+            ((name, data['xp mark']) for (name, data) in students),
+            title='STUDENT XP MARKS', header=False, sep='\t'
+        )
 
-        s += f"\nTotal XP earned:  {averages['total xp']}"
-        s += f"\nWeekly XP earned: {averages['weekly xp']}"
-        s += f"\n100% weeks:       {averages['100% weeks']}"
-        s += f"\n50% weeks:        {averages['50% weeks']}"
-        s += f"\nXP mark:          {averages['xp mark']}%"
-        s += f"\nConsistency mark: {averages['consistency mark']}%"
+        sink.heading('STUDENT XP COMMENTS')
+        for (name, data) in students:
+            sink.paragraph([name, data['xp comment']])
 
-        # Students
-
-        s += "\n\nSTUDENT XP MARKS"
-  
-        for stu in sorted(self.students.values(), key=lambda s: s.name):
-            data = report["students"][stu.name]
-            s += f'\n{stu.name.ljust(name_fill)}\t{data["xp mark"]:>3}'
-        
-        s += "\n\nSTUDENT XP COMMENTS"
-  
-        for stu in sorted(self.students.values(), key=lambda s: s.name):
-            data = report["students"][stu.name]
-            s += f'\n\n{stu.name}\n{data["xp comment"]}'
-
-        s += "\n\nSTUDENT CONSISTENCY MARKS"
-  
-        for stu in sorted(self.students.values(), key=lambda s: s.name):
-            data = report["students"][stu.name]
-            s += f'\n{stu.name.ljust(name_fill)}\t{data["consistency mark"]:>3}'
-        
-        s += "\n\nSTUDENT CONSISTENCY COMMENTS"
-  
-        for stu in sorted(self.students.values(), key=lambda s: s.name):
-            data = report["students"][stu.name]
-            s += f'\n\n{stu.name}\n{data["consistency comment"]}'
+        sink.table(
+            [Column('Name', name_fill), Column('Consistency mark', 3, '>')],
+            ((name, data['consistency mark']) for (name, data) in students),
+            title='STUDENT CONSISTENCY MARKS', header=False, sep='\t'
+        )
 
-        return s
+        sink.heading('STUDENT CONSISTENCY COMMENTS')
+        for (name, data) in students:
+            sink.paragraph([name, data['consistency comment']])
     
 # Helpers
-    
-def date_to_dt(date: datetime.date) -> datetime.datetime:
-    return datetime.datetime(date.year, date.month, date.day, 0, 0)
 
+@functools.lru_cache(maxsize=1)
+def load_report_template(path: Path, mtime: int) -> ReportTemplate:
+    return ReportTemplate(path)
+
+def get_report_template(path: Path) -> ReportTemplate:
+    """
+    Read once, and again only when the template is saved. Only the latest version is kept.
+    """
+    return load_report_template(path, path.stat().st_mtime_ns)
+
+def copy_style(source: Cell | ColumnDimension) -> dict[str]:
+    from copy import copy
+
+    return {
+        attr: copy(getattr(source, attr))
+        for attr in ('font', 'fill', 'border', 'alignment', 'number_format', 'protection')
+    }
+
+def copy_cell(ws: object, source: Cell, value: object) -> WriteOnlyCell:
+    from openpyxl.cell import WriteOnlyCell
+
+    cell = WriteOnlyCell(ws, value)
+    for (attr, style) in copy_style(source).items():
+        setattr(cell, attr, style)
+
+    return cell
+
+def read_input_files(paths: list[Path], workers: int=1) -> list[ParsedFile]:
+    """
+    Results come back in the order of paths. workers=0 means one per core.
+    """
+    if workers == 1 or len(paths) < 2:
+        results = []
+        for path in paths:
+            with profiler.stage('read_input_file', file=path.name):
+                results.append(read_input_file(path))
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with profiler.stage('read_input_files', files=len(paths), workers=workers), ProcessPoolExecutor(max_workers=workers or None) as pool:
+        return list(pool.map(read_input_file, paths, chunksize=max(1, len(paths) // 32)))
+
+def read_input_file(path: Path) -> ParsedFile:
+    """
+    Everything in one export that doesn't depend on the variables, so it can be cached.
+    """
+    ts_start, ts_end = path.stem.split()
+    dt_start = datetime.datetime.strptime(f'{ts_start} 00-00', FMT_DT_INPUT)
+    dt_end = datetime.datetime.strptime(f'{ts_end} 11-59', FMT_DT_INPUT)
+
+    dates = [dt_to_date(dt_start), dt_to_date(dt_end)]
+    records = []
+
+    desc = f'Main panel week summary {ts_start} to {ts_end}'
+
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+
+        for row in reader:
+            # Name, Username, Email, ..., ..., ..., ..., ..., ..., Total XP, ...rest
+
+            alias = row[1]
+            xp = int(row[10])
+            records.append((alias, desc, xp, dt_start))
+
+    return dates, records
+    
 def dt_to_date(dt: datetime.datetime) -> datetime.date:
     return datetime.date(dt.year, dt.month, dt.day)
+
+def dt_key(dt: datetime.datetime) -> int:
+    """
+    Microseconds since 0001-01-01, which orders exactly as the datetimes do.
+    """
+    return (dt.toordinal() * 86_400 + dt.hour * 3_600 + dt.minute * 60 + dt.second) * 1_000_000 + dt.microsecond
+
+def key_dt(key: int) -> datetime.datetime:
+    """
+    The datetime back from dt_key.
+    """
+    return datetime.datetime.min + datetime.timedelta(microseconds=key - DAY_MICROSECONDS)
+
+def get_desc_id(desc: str) -> int:
+    try:
+        return DESC_IDS[desc]
+    except KeyError:
+        DESCS.append(desc)
+        return DESC_IDS.setdefault(desc, len(DESCS) - 1)
     
 def clean_lines(f: TextIO) -> str:
     return map(str.lower, filter(None, map(str.strip, f.readlines())))
 
 # Operations
 
+def parse_week_range(spec: str | None, n: int) -> list[int]:
+    """
+    Turns 1-based week positions like '3', '3-8', '5-' or '-4' into 0-based indices.
+    """
+    if not spec:
+        return list(range(n))
+
+    first, _, last = spec.strip().partition('-')
+    if not _:
+        last = first
+
+    if not all(part.isdecimal() for part in (first, last) if part):
+        raise ValueError(f'invalid week range: {spec}')
+
+    first = int(first) if first else 1
+    last = int(last) if last else n
+
+    return list(range(max(first, 1) - 1, min(last, n)))
+
 def pick_student(d: DuolingoMarker) -> Student:
     choices = sorted(d.students)
     choice_str = ''
@@ -475,44 +1195,275 @@ def pick_student(d: DuolingoMarker) -> Student:
     number = int(input('Selection (enter number): '))
     return d.students[choices[number - 1]]
 
-def make_marker() -> DuolingoMarker:
-    d = DuolingoMarker()
+def pick_alias(d: DuolingoMarker, alias: str, rows: int, suggestions: list[str]) -> str | None:
+    choice_str = ''
+    for (i, name) in enumerate(suggestions):
+        choice_str += f'{i + 1:>2}: {name}\n'
+
+    print(f'\nUnknown username {alias} ({rows} row(s)). Closest students:\n\n{choice_str}')
+
+    while True:
+        choice = normalize(input(f"Enter a number or a student's name, {PLACEHOLDER_SKIP} to always skip it, or nothing to leave it out this time: "))
+
+        if not choice:
+            return None
+        elif choice == PLACEHOLDER_SKIP or choice in d.students:
+            return choice
+        elif choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+            return suggestions[int(choice) - 1]
+
+        print('No such student')
+
+def make_marker(root: Path | None=None, use_store: bool=USE_STORE, workers: int=WORKERS, profile: bool=PROFILE, interactive: bool=False) -> DuolingoMarker:
+    if profile:
+        profiler.enable()
+
+    d = DuolingoMarker(root)
+    d.interactive = interactive
     d.parse_variables()
-    d.parse_input_files()
+
+    if use_store:
+        from practice_store import PracticeStore
+        d.attach_store(PracticeStore(d.path_store))
+
+    d.parse_input_files(workers=workers)
     return d
 
 # Programs
 
-def do_final_report() -> None:
+def save_trace(d: DuolingoMarker) -> None:
+    if profiler.enabled:
+        profiler.save(d.path_output / 'trace.json')
+
+def do_final_report(profile: bool=PROFILE) -> None:
     # TODO To be honest I'd rather output this to a spreadsheet
 
     print('Final report')
-    d = make_marker()
-    d.save_final_report()
+    d = make_marker(profile=profile, interactive=True)
+
+    try:
+        d.save_final_report()
+    except ValueError as e:
+        print(e)
+
+    save_trace(d)
     # print(d.format_final_report())
     input('\nPress Enter to exit')
 
-def do_weekly_class_report() -> None:
+def do_weekly_class_report(profile: bool=PROFILE) -> None:
     print('Weekly class report')
-    d = make_marker()
+    d = make_marker(profile=profile, interactive=True)
     d.show_weeks()
+    save_trace(d)
     input('\nPress Enter to exit')
 
-def do_weekly_student_report() -> None:
+def do_weekly_student_report(profile: bool=PROFILE) -> None:
     print('Weekly student report')
-    d = make_marker()
+    d = make_marker(profile=profile, interactive=True)
     s = pick_student(d)
     
-    print(s)
+    weeks = d.get_weeks()
+    numbers = d.get_week_numbers(weeks)
+    print(d.format_student_weeks(s, weeks, numbers))
+    save_trace(d)
+
+def do_headless(argv: list[str]) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write reports without any prompts.')
+    parser.add_argument('report', choices=['weekly', 'student', 'final', 'all', 'watch', 'export', 'serve', 'reconcile'])
+    parser.add_argument('--weeks', help='week positions, oldest first: 3, 3-8, 5- or -4 (default: all)')
+    parser.add_argument('--students', help='comma-separated names for student reports (default: all)')
+    parser.add_argument('--output', type=Path, help='directory for report files (default: print them)')
+    parser.add_argument('--root', type=Path, help='classroom folder with its own variables.txt and input/')
+    parser.add_argument('--profile', action='store_true', help='time each stage and write trace.json beside the reports')
+    parser.add_argument('--port', type=int, help='port for serve, which only listens on localhost')
+    parser.add_argument('--style', choices=list(render.SINKS), default='text', help='layout of the text reports (default: text)')
+    parser.add_argument('--formats', default=','.join(EXPORT_FORMATS), help=f'comma-separated export formats: {", ".join(FORMATS)}')
+    args = parser.parse_args(argv)
+
+    formats = list(map(str.strip, args.formats.lower().split(',')))
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f'unknown export formats: {", ".join(sorted(unknown))}')
+
+    # Only the weekly and student reports pick their weeks, and only the student report its students
+    if args.weeks is not None and args.report not in ('weekly', 'student', 'all'):
+        parser.error(f'--weeks does not apply to the {args.report} report')
+    if args.students is not None and args.report not in ('student', 'all'):
+        parser.error(f'--students does not apply to the {args.report} report')
+
+    d = make_marker(args.root, profile=args.profile or PROFILE)
+
+    if args.report == 'watch':
+        if args.output:
+            d.path_output = args.output
+
+        watch_input(d, args.style)
+        return
+
+    if args.report == 'serve':
+        import server
+
+        if args.output:
+            d.path_output = args.output
+
+        server.serve(d, port=args.port or server.PORT)
+        return
 
     weeks = d.get_weeks()
+    if not weeks:
+        print('No data found')
+        return
+
     numbers = d.get_week_numbers(weeks)
+    try:
+        chosen = parse_week_range(args.weeks, len(weeks))
+    except ValueError as e:
+        parser.error(str(e))
+
+    students = d.get_sorted_students()
+    if args.students:
+        names = set(map(str.strip, args.students.lower().split(',')))
+        students = [stu for stu in students if stu.name in names]
+
+        missing = names - set(stu.name for stu in students)
+        if missing:
+            parser.error(f'unknown students: {", ".join(sorted(missing))}')
+
+    if args.output:
+        args.output.mkdir(parents=True, exist_ok=True)
+        d.path_output = args.output
+
+    # Each report is rendered straight into its file, or onto the screen
+    def emit(name: str, write: Callable[[render.Sink], None]) -> None:
+        make_sink = render.SINKS[args.style]
+
+        if args.output:
+            with open(args.output / f'{name}.{render.EXTENSIONS[args.style]}', 'w', newline='', encoding='utf-8') as f:
+                write(make_sink(f))
+        else:
+            write(make_sink(sys.stdout))
+            print()
+
+    # Every week for every student, once, for the reports that go week by week
+    if args.report in ('weekly', 'student', 'all'):
+        everyone = d.get_sorted_students()
+        matrix = d.get_xp_matrix(everyone, d.get_calendar()).tolist()
+        rows = {stu.name: row for (stu, row) in zip(everyone, matrix)}
+
+    if args.report in ('weekly', 'all'):
+        for i in reversed(chosen):
+            start, end = weeks[i]
+            xps = [row[i] for row in matrix]
+            emit(f'week {start}', lambda sink: d.render_week(sink, start, end, numbers[i], xps, everyone))
+
+    if args.report in ('student', 'all'):
+        some_weeks = [weeks[i] for i in chosen]
+        some_numbers = [numbers[i] for i in chosen]
+
+        histories = {stu.name: [rows[stu.name][i] for i in chosen] for stu in students}
+        for stu in students:
+            emit(f'student {stu.name}', lambda sink: d.render_student_weeks(sink, stu, some_weeks, some_numbers, histories[stu.name]))
+
+        if args.output:
+            d.save_student_reports(students, some_weeks, some_numbers, histories, args.output)
+
+    if args.report in ('final', 'all'):
+        try:
+            report = d.calculate_final_report()
+        except ValueError as e:
+            print(e)
+        else:
+            d.save_final_report(report)
+            emit('final_report', lambda sink: d.render_final_report(sink, report))
+
+    if args.report == 'export':
+        try:
+            d.export_marks(formats)
+        except ValueError as e:
+            print(e)
+
+    if args.report == 'reconcile':
+        import reconcile
+
+        r = reconcile.reconcile(d, WORKERS)
+        emit('reconcile', lambda sink: reconcile.render_reconciliation(sink, r))
+
+        if args.output:
+            for path in reconcile.save_reconciliation(r, args.output):
+                print(f'Saved reconciliation to {path}')
+
+    save_trace(d)
+
+def watch_input(d: DuolingoMarker, style: str='text') -> None:
+    """
+    Rewrite the affected weekly reports and the final report whenever exports land in input/.
+    The weekly reports are laid out as style, like the headless weekly report.
+    """
+    make_sink = render.SINKS[style]
+    extension = render.EXTENSIONS[style]
+
+    def update(paths: set[Path]) -> None:
+        names = ', '.join(sorted(path.name for path in paths))
+        keys = [str(path.resolve()) for path in paths]
+
+        with profiler.stage('watch update', files=len(paths)):
+            # What the reports said before: a changed or deleted file's old weeks need rewriting too
+            before = d.get_weeks() or []
+            labels = dict(zip(before, d.get_week_numbers(before)))
+            spans = [d.files[key][1:] for key in keys if key in d.files]
+
+            # A half-saved or unexpected file shouldn't end the watch; it keeps what it had and the next save retries it
+            if d.store is not None:
+                try:
+                    d.parse_input_files()
+                except Exception as e:
+                    print(f'Could not read {names}: {type(e).__name__}: {e}')
+                    return
+            else:
+                for path in sorted(paths):
+                    try:
+                        d.parse_input_file(path)
+                    except Exception as e:
+                        print(f'Could not read {path.name}: {type(e).__name__}: {e}')
+
+            weeks = d.get_weeks() or []
+            spans += [d.files[key][1:] for key in keys if key in d.files]
+
+            # Weeks that are gone shouldn't leave their reports behind
+            for (start, _) in set(before) - set(weeks):
+                (d.path_output / f'week {start}.{extension}').unlink(missing_ok=True)
+
+            if not weeks:
+                print('No data found')
+                return
+
+            numbers = d.get_week_numbers(weeks)
+            students = d.get_sorted_students()
+            d.path_output.mkdir(parents=True, exist_ok=True)
+
+            # Besides the weeks the files cover, any week that is new or renumbered, e.g. after a backfill
+            for (week, number) in zip(weeks, numbers):
+                start, end = week
+                if labels.get(week) != number or any(first <= end and start <= last for (first, last) in spans):
+                    with open(d.path_output / f'week {start}.{extension}', 'w', newline='', encoding='utf-8') as f:
+                        d.render_week(make_sink(f), start, end, number, students=students)
+
+            try:
+                d.save_final_report()
+            except ValueError as e:
+                print(e)
+
+        print(f'{datetime.datetime.now():%H:%M:%S} Updated from {names}')
+        save_trace(d)
+
+    print(f'Watching {d.path_input} (Ctrl+C to stop)')
 
-    for (week, number) in reversed(list(zip(weeks, numbers))):
-        start, end = week
-        header = f'{number} {start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}'
-        xp = s.xp_between(date_to_dt(start), date_to_dt(end))
-        print(f'{header}: {xp}')
+    try:
+        watch.watch(d.get_input_paths, update)
+    except KeyboardInterrupt:
+        print('\nStopped')
 
 def run():
     choice = input("Hit Enter for weekly report, or 1 for student report, or 2 for final report: ").strip()
@@ -527,4 +1478,7 @@ def run():
 # Go
 
 if __name__ == '__main__':
-    run()
+    if len(sys.argv) > 1:
+        do_headless(sys.argv[1:])
+    else:
+        run()
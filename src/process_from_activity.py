@@ -13,13 +13,23 @@
 
 from __future__ import annotations
 import re
+import sys
 import datetime
+import hashlib
 from pathlib import Path
-from typing import TextIO
+from typing import Iterable, Iterator, TextIO
 from functools import total_ordering
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from parse_cache import ParseCache
+from timestamps import parse_timestamp
+from weeks import WeekCalendar
 
 PATH_VARIABLES = Path(__file__).parent / 'config/variables.txt'
 PATH_INPUT = Path(__file__).parent / 'input'
+PATH_OUTPUT = Path(__file__).parent / 'output' / 'students'
+PATH_CACHE = Path(__file__).parent / 'cache/process_from_activity.pickle'
 
 FMT_DT_INPUT1 = '%b %d, %Y %H h %M'
 FMT_DT_INPUT2 = '%b %d, %Y %I:%M %p'
@@ -27,29 +37,104 @@ FMT_DT_OUTPUT = '%Y-%m-%d %H-%M'
 FMT_DT_OUTPUT_NICE = '%Y-%m-%d %H:%M'
 FMT_DATE_OUTPUT = '%Y-%m-%d (%a)'
 
-RE_NAME = r'^([-_a-z\(\)\. ]+) (completed|practiced|tested)'
-RE_XP = r'^\+(\d+) xp'
-RE_DATE1 = r'^([a-z]+) (\d+), (\d+) (\d+) h (\d+)'
-RE_DATE2 = r'([a-z]+) (\d+), (\d+) (\d+):(\d+) (a\.m\.|p\.m\.)'
+RE_NAME = re.compile(r'^([-_a-z\(\)\. ]+) (completed|practiced|tested)')
+RE_XP = re.compile(r'^\+(\d+) xp')
+# (date, time); months in any language the activity panel comes in, so letters beyond a-z and maybe a dot
+RE_DATE1 = re.compile(r'^([^\W\d_]+\.? \d+, \d+) (\d+ h \d+)')
+RE_DATE2 = re.compile(r'([^\W\d_]+\.? \d+, \d+) (\d+:\d+ [ap]\.m\.)')
+
+# Either of the above; the match's lastgroup says which
+RE_DATE = re.compile(f'(?P<h24>{RE_DATE1.pattern})|(?P<h12>{RE_DATE2.pattern})')
+
+# Processes for reading input files; 0 for one per core
+WORKERS = 1
+
+# (alias, desc, xp, dt)
+Record = tuple[str, str, int, datetime.datetime]
+
+# (dates seen, records, number of malformed records, fingerprints of the records)
+ParsedFile = tuple[list[datetime.date], list[Record], int, array]
+
+# Fingerprints of records already read by this worker process, see read_shared
+SHARED_SEEN: set[int] = set()
+
+# Every desc seen, once, so that a practice only keeps its number here
+DESCS: list[str] = []
+DESC_IDS: dict[str, int] = {}
 
 # Classes
 
 class Student:
+    """
+    Practices are kept column by column, one row each: the time as dt_key, the XP
+    and the desc's number in DESCS. A Practice is only made when something asks for one.
+    """
     name: str
-    practices: set[Practice]
+    times: array
+    xps: array
+    descs: array
+    cumulative_xp: array
+    indexed: bool
 
     def __init__(self: Student, name: str) -> None:
         self.name = name
-        self.practices = set()
+        self.times = array('q')
+        self.xps = array('q')
+        self.descs = array('I')
+        self.cumulative_xp = array('q', [0])
+        self.indexed = True
+
+    def add_practice(self: Student, desc: str, xp: int, dt: datetime.datetime) -> None:
+        self.times.append(dt_key(dt))
+        self.xps.append(xp)
+        self.descs.append(get_desc_id(desc))
+        self.indexed = False
+
+    def build_index(self: Student) -> None:
+        # Sorted by time, with a running XP total, so that a range is two bisects.
+        # Plain int64 arrays keep this small and can be handed to NumPy as they are.
+        rows = sorted(range(len(self.times)), key=lambda i: (self.times[i], self.descs[i], self.xps[i]))
+
+        # The same practice pasted twice is counted once, as the Practice set used to:
+        # same desc and XP at the same minute, and times are only ever to the minute
+        rows = [i for (n, i) in enumerate(rows) if n == 0 or self.row(i) != self.row(rows[n - 1])]
+
+        self.times = array('q', [self.times[i] for i in rows])
+        self.xps = array('q', [self.xps[i] for i in rows])
+        self.descs = array('I', [self.descs[i] for i in rows])
+        self.cumulative_xp = array('q', accumulate(self.xps, initial=0))
+        self.indexed = True
+
+    def row(self: Student, i: int) -> tuple[int, int, int]:
+        return self.times[i], self.descs[i], self.xps[i]
+
+    def practice(self: Student, i: int) -> Practice:
+        return Practice(self, DESCS[self.descs[i]], self.xps[i], key_dt(self.times[i]))
+
+    def get_practices(self: Student) -> list[Practice]:
+        if not self.indexed:
+            self.build_index()
+
+        return list(map(self.practice, range(len(self.times))))
+
+    def bounds_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> tuple[int, int]:
+        if not self.indexed:
+            self.build_index()
+
+        lo = bisect_left(self.times, dt_key(start))
+        hi = bisect_right(self.times, dt_key(end))
+        return lo, max(lo, hi)
 
     def practices_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> set[Practice]:
-        return set(filter(lambda p: p.is_between(start, end), self.practices))
+        lo, hi = self.bounds_between(start, end)
+        return set(map(self.practice, range(lo, hi)))
     
     def practices_between_date(self: Student, start: datetime.date, end: datetime.date) -> set[Practice]:
         return self.practices_between(date_to_dt(start), date_to_dt(end, end=True))
     
     def xp_between(self: Student, start: datetime.datetime, end: datetime.datetime) -> int:
-        return sum(p.xp for p in self.practices_between(start, end))
+        lo, hi = self.bounds_between(start, end)
+        return self.cumulative_xp[hi] - self.cumulative_xp[lo]
     
     def xp_between_date(self: Student, start: datetime.date, end: datetime.date) -> int:
         return self.xp_between(date_to_dt(start), date_to_dt(end, end=True))
@@ -62,6 +147,9 @@ class Student:
 
 @total_ordering
 class Practice:
+    # Slotted, with one shared copy of each desc, as there are a great many of these
+    __slots__ = ('student', 'desc', 'xp', 'date')
+
     student: Student
     desc: str
     xp: int
@@ -69,7 +157,7 @@ class Practice:
 
     def __init__(self: Practice, student: Student, desc: str, xp: int, date: datetime.datetime) -> None:
         self.student = student
-        self.desc = desc
+        self.desc = sys.intern(desc)
         self.xp = xp
         self.date = date
 
@@ -77,7 +165,9 @@ class Practice:
         return start <= self.date <= end
 
     def __hash__(self: Practice) -> int:
-        return hash((self.student, self.desc, self.xp, self.date.strftime(FMT_DT_OUTPUT)))
+        # To the minute, like FMT_DT_OUTPUT, without formatting a string
+        d = self.date
+        return hash((self.student, self.desc, self.xp, d.toordinal(), d.hour, d.minute))
     
     def __repr__(self: Practice) -> str:
         return f'{self.date.strftime("%a")}, {self.date.strftime(FMT_DT_OUTPUT_NICE)} : {self.xp} ({self.desc})'
@@ -104,6 +194,8 @@ class DuolingoMarker:
     goal: int
     bonus_weeks: set[datetime.date]
     dates: set[datetime.date]
+    calendar: WeekCalendar | None
+    malformed: int
 
     def __init__(self: DuolingoMarker) -> None:
         self.students = {}
@@ -111,9 +203,11 @@ class DuolingoMarker:
         self.goal: 0
         self.bonus_weeks = set()
         self.dates = set()
+        self.calendar = None
+        self.malformed = 0
 
-    def parse_variables(self: DuolingoMarker):
-        with open(PATH_VARIABLES, 'r') as f:
+    def parse_variables(self: DuolingoMarker, path: Path=PATH_VARIABLES):
+        with open(path, 'r') as f:
 
             lines = list(filter(lambda L: L and not L.startswith(';'), map(str.strip, f.readlines())))
             i = 0
@@ -156,56 +250,55 @@ class DuolingoMarker:
 
                 i += 1
 
-    def parse_input_files(self: DuolingoMarker) -> None:        
-        paths = PATH_INPUT.glob('*.txt')
+    def parse_input_files(self: DuolingoMarker, use_cache: bool=True, workers: int=WORKERS) -> None:
+        cache = ParseCache(PATH_CACHE)
+        if use_cache:
+            cache.load()
+
+        paths = sorted(p for p in PATH_INPUT.glob('*.txt') if not p.stem.startswith('_'))
+        parsed = {path: cache.get(path) for path in paths}
+
+        # A file's records leave out those already read from files before it, so once one of
+        # those has changed or gone, every file read since then has to be read again
+        keys = {str(path.resolve()): path for path in paths}
+        stale = [key for key in cache.entries if key not in keys or parsed[keys[key]] is None]
+        if stale:
+            cache.evict_since(stale)
+            parsed = {path: parsed[path] if key in cache.entries else None for (key, path) in keys.items()}
+
+        missing = [path for path in paths if parsed[path] is None]
+        seen = set()
+        if missing:
+            for result in parsed.values():
+                if result is not None:
+                    seen.update(result[3])
+
+        for (path, result) in zip(missing, read_input_files(missing, workers, seen)):
+            parsed[path] = result
+            cache.put(path, result)
+
+        # Always in path order, however the files were read
         for path in paths:
-            if path.stem.startswith('_'):
-                continue
+            self.ingest(parsed[path])
 
-            self.parse_input_file(path)
+            if parsed[path][2]:
+                print(f'Skipped {parsed[path][2]} incomplete record(s) in {path.name}')
 
-    def parse_input_file(self: DuolingoMarker, path: Path) -> None:
+        if use_cache:
+            cache.evict_unseen()
+            cache.save()
 
-        with open(path, 'r') as f:
+    def parse_input_file(self: DuolingoMarker, path: Path) -> None:
+        self.ingest(read_input_file(path))
 
-            state = 0
-            for line in clean_lines(f):
-
-                if state == 0:
-                    m = re.search(RE_NAME, line)
-                    if m:
-                        alias = m.group(1).strip()
-                        desc = m.group(2).strip()
-                        student = self.aliases[alias]
-                        state = 1
-
-                elif state == 1:
-                    m = re.search(RE_XP, line)
-                    if m:
-                        xp = int(m.group(1))
-                        state = 2
-
-                elif state == 2:
-                    m1 = re.search(RE_DATE1, line)
-                    m2 = re.search(RE_DATE2, line)
-                    if (m1 or m2):
-
-                        if m1:
-                            m = m1
-                            fmt = FMT_DT_INPUT1
-                        else:
-                            m = m2
-                            fmt = FMT_DT_INPUT2
-                        
-                        dt = datetime.datetime.strptime(m.group(0).capitalize().replace('.', ''), fmt)
-                        date = datetime.date(dt.year, dt.month, dt.day)
-                        self.dates.add(date)
-
-                        practice = Practice(student, desc, xp, dt)
-                        student.practices.add(practice)
-                        
-                        state = 0
+    def ingest(self: DuolingoMarker, parsed: ParsedFile) -> None:
+        dates, records, malformed, _ = parsed
+        self.dates.update(dates)
+        self.calendar = None
+        self.malformed += malformed
 
+        for (alias, desc, xp, dt) in records:
+            self.aliases[alias].add_practice(desc, xp, dt)
 
     def show_weeks(self: DuolingoMarker) -> None:
         weeks = self.get_weeks()
@@ -230,52 +323,81 @@ class DuolingoMarker:
         
         print('\nFinished')
 
+    def get_calendar(self: DuolingoMarker) -> WeekCalendar:
+        if self.calendar is None:
+            self.calendar = WeekCalendar(self.dates, self.bonus_weeks, '--')
+
+        return self.calendar
+
     def get_weeks(self: DuolingoMarker) -> list[tuple[datetime.date]]:
         if not self.dates:
             return
-        
-        weeks = []
 
-        start = None
+        return self.get_calendar().weeks
+    
+    def get_week_numbers(self: DuolingoMarker, weeks: list[tuple[datetime.date]]) -> list[str]:
+        calendar = self.get_calendar()
+        return [calendar.label_of(start) for (start, _) in weeks]
+
+    def bucket_practices(self: DuolingoMarker) -> dict[str, list[list[Practice]]]:
+        """
+        Every student's practices, by week, in one sweep over each student's index.
+        """
+        return {stu.name: self.bucket_student(stu) for stu in self.students.values()}
+
+    def bucket_student(self: DuolingoMarker, stu: Student) -> list[list[Practice]]:
+        """
+        One student's practices, by week.
+        """
+        calendar = self.get_calendar()
+        weeks = [[] for _ in calendar.weeks]
+
+        for p in stu.get_practices():
+            j = calendar.week_of(p.date)
+            if j >= 0:
+                weeks[j].append(p)
 
-        for date in sorted(self.dates):
+        return weeks
 
-            # Started week?
-            if start is None:
-                start = date
-                end = None
+    def format_student_detailed(self: DuolingoMarker, stu: Student, weeks: list[tuple[datetime.date]], numbers: list[str], buckets: list[list[Practice]]) -> str:
+        """
+        Newest week first. buckets follows weeks.
+        """
+        s = f'{stu}\n'
 
-            # Sunday?
-            if date.strftime('%w') == '0':
-                end = date
-                weeks.append((start, end))
-                start = None
-        
-        # Didn't end on a Sunday?
-        if end is None:
-            end = date
-            weeks.append((start, end))
+        for ((start, end), number, practices) in reversed(list(zip(weeks, numbers, buckets))):
+            if number.strip().isdigit():
+                label = f'Week {number:>2}   '
+            else:
+                label = f'Bonus Week'
 
-        return weeks
-    
-    def get_week_numbers(self: DuolingoMarker, weeks: list[tuple[datetime.date]]) -> list[str]:
-        n = 1
-        numbers = []
+            xp = sum(p.xp for p in practices)
+            s += f'\n{label} ({start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}) : {xp:>4} XP\n'
 
-        boni = self.bonus_weeks.copy()
+            for p in sorted(practices, reverse=True):
+                s += f'\n\t{p}'
 
-        for (start, end) in weeks:
-            for bonus in boni:
-                if start <= bonus <= end:
-                    numbers.append('--')
-                    boni.remove(bonus)
-                    break
+            s += '\n'
 
-            else:
-                numbers.append(f'{n:>2}')
-                n += 1
-        
-        return numbers
+        return s
+
+    def save_student_workbook(self: DuolingoMarker, stu: Student, weeks: list[tuple[datetime.date]], numbers: list[str], buckets: list[list[Practice]], path: Path) -> None:
+        import openpyxl
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('Weeks')
+        ws.append(['Week', 'Start', 'End', 'XP', 'Counted'])
+        practices = wb.create_sheet('Practices')
+        practices.append(['Week', 'Date', 'XP', 'Activity'])
+
+        for ((start, end), number, bucket) in reversed(list(zip(weeks, numbers, buckets))):
+            xp = sum(p.xp for p in bucket)
+            ws.append([number.strip(), start, end, xp, min(self.goal, xp)])
+
+            for p in sorted(bucket, reverse=True):
+                practices.append([number.strip(), p.date, p.xp, p.desc])
+
+        wb.save(path)
 
     def format_week(self: DuolingoMarker, start: datetime.date, end: datetime.date, label: str='') -> None:
         if label:
@@ -295,7 +417,114 @@ class DuolingoMarker:
         return s
     
 # Helpers
+
+def read_input_files(paths: list[Path], workers: int=1, seen: set[int] | None=None) -> list[ParsedFile]:
+    """
+    Results come back in the order of paths. workers=0 means one per core.
+    Records in seen are left out, and so are those read from an earlier path;
+    reading one worker at a time, seen collects them all.
+    """
+    if seen is None:
+        seen = set()
+
+    if workers == 1 or len(paths) < 2:
+        return [read_input_file(path, seen) for path in paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Each worker gets its own copy of seen, once, rather than one per task
+    with ProcessPoolExecutor(max_workers=workers or None, initializer=share_seen, initargs=(seen,)) as pool:
+        return list(pool.map(read_shared, paths, chunksize=max(1, len(paths) // 32)))
+
+def share_seen(seen: set[int]) -> None:
+    SHARED_SEEN.update(seen)
+
+def read_shared(path: Path) -> ParsedFile:
+    return read_input_file(path, SHARED_SEEN)
+
+def read_input_file(path: Path, seen: set[int] | None=None) -> ParsedFile:
+    dates = set()
+    records = []
+    malformed = 0
+    fingerprints = array('Q')
+
+    with open(path, 'r') as f:
+        for record in parse_records(clean_lines(f), set() if seen is None else seen, fingerprints):
+            if record is None:
+                malformed += 1
+                continue
+
+            dates.add(dt_to_date(record[3]))
+            records.append(record)
+
+    return sorted(dates), records, malformed, fingerprints
+
+def parse_records(lines: Iterable[str], seen: set[int] | None=None, fingerprints: array | None=None) -> Iterator[Record | None]:
+    """
+    Yields each record as it is completed, or None for one that was cut off by the next name or the end.
+    A record whose fingerprint is in seen is skipped before its date is parsed;
+    a new one's goes into seen and fingerprints.
+    """
+    if seen is None:
+        seen = set()
+
+    state = 0
+    for line in lines:
+
+        if state == 1:
+            m = RE_XP.match(line)
+            if m:
+                xp = m.group(1)
+                state = 2
+                continue
+
+        elif state == 2:
+            m = RE_DATE.search(line)
+            if m:
+                state = 0
+
+                # Pastes overlap, so most records have been read before
+                fingerprint = get_fingerprint(alias, desc, xp, m.group(0))
+                if fingerprint in seen:
+                    continue
+
+                seen.add(fingerprint)
+                if fingerprints is not None:
+                    fingerprints.append(fingerprint)
+
+                if m.lastgroup == 'h24':
+                    dt = parse_timestamp(m[2], m[3])
+                    fmt = FMT_DT_INPUT1
+                else:
+                    dt = parse_timestamp(m[5], m[6])
+                    fmt = FMT_DT_INPUT2
+
+                # Whatever the tables don't know, strptime accepts or rejects as it always has
+                if dt is None:
+                    dt = datetime.datetime.strptime(m.group(0).capitalize().replace('.', ''), fmt)
+
+                yield (alias, desc, int(xp), dt)
+                continue
+
+        m = RE_NAME.match(line)
+        if m:
+            if state != 0:
+                yield None
+
+            alias = m.group(1).strip()
+            desc = sys.intern(m.group(2).strip())
+            state = 1
+
+    if state != 0:
+        yield None
     
+def get_fingerprint(alias: str, desc: str, xp: str, date: str) -> int:
+    """
+    64 bits of a record's text as it was pasted, the same in every run.
+    """
+    text = f'{alias}\x1f{desc}\x1f{xp}\x1f{date}'.encode()
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest())
+
 def date_to_dt(date: datetime.date, end: bool=False) -> datetime.datetime:
     if end:
         h, m = 23, 59
@@ -306,9 +535,28 @@ def date_to_dt(date: datetime.date, end: bool=False) -> datetime.datetime:
 
 def dt_to_date(dt: datetime.datetime) -> datetime.date:
     return datetime.date(dt.year, dt.month, dt.day)
+
+def dt_key(dt: datetime.datetime) -> int:
+    """
+    Microseconds since 0001-01-01, which orders exactly as the datetimes do.
+    """
+    return (dt.toordinal() * 86_400 + dt.hour * 3_600 + dt.minute * 60 + dt.second) * 1_000_000 + dt.microsecond
+
+def key_dt(key: int) -> datetime.datetime:
+    """
+    The datetime back from dt_key.
+    """
+    return datetime.datetime.min + datetime.timedelta(microseconds=key - 86_400_000_000)
+
+def get_desc_id(desc: str) -> int:
+    try:
+        return DESC_IDS[desc]
+    except KeyError:
+        DESCS.append(desc)
+        return DESC_IDS.setdefault(desc, len(DESCS) - 1)
     
-def clean_lines(f: TextIO) -> str:
-    return map(str.lower, filter(None, map(str.strip, f.readlines())))
+def clean_lines(f: TextIO) -> Iterator[str]:
+    return map(str.lower, filter(None, map(str.strip, f)))
 
 # Operations
 
@@ -322,10 +570,10 @@ def pick_student(d: DuolingoMarker) -> Student:
     number = int(input('Selection (enter number): '))
     return d.students[choices[number - 1]]
 
-def make_marker() -> DuolingoMarker:
+def make_marker(workers: int=WORKERS) -> DuolingoMarker:
     d = DuolingoMarker()
     d.parse_variables()
-    d.parse_input_files()
+    d.parse_input_files(workers=workers)
     return d
 
 # Programs
@@ -343,7 +591,7 @@ def mark_student() -> None:
     
     print(s)
 
-    print(sorted(s.practices, reverse=True))
+    print(sorted(s.get_practices(), reverse=True))
 
     weeks = d.get_weeks()
     numbers = d.get_week_numbers(weeks)
@@ -358,28 +606,33 @@ def mark_student_detailed() -> None:
     print('Detailed student report')
     d = make_marker()
     s = pick_student(d)
-    
-    print(s)  
-    print()
 
     weeks = d.get_weeks()
     numbers = d.get_week_numbers(weeks)
+    print(d.format_student_detailed(s, weeks, numbers, d.bucket_student(s)))
 
-    for (week, number) in reversed(list(zip(weeks, numbers))):      
-        start, end = week
-        
-        if number.strip().isdigit():
-            label = f'Week {number:>2}   '
-        else:
-            label = f'Bonus Week'
+def mark_students() -> None:
+    """
+    A detailed report, as text and as a workbook, for every student at once.
+    """
+    print('Detailed reports for every student')
+    d = make_marker()
 
-        print(f'{label} ({start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}) : {s.xp_between_date(start, end):>4} XP')
-        print()
+    weeks = d.get_weeks()
+    if not weeks:
+        print('No data found')
+        return
 
-        for p in sorted(s.practices_between_date(start, end), reverse=True):
-            print(f'\t{p}')
-        
-        print()
+    numbers = d.get_week_numbers(weeks)
+    buckets = d.bucket_practices()
+
+    PATH_OUTPUT.mkdir(parents=True, exist_ok=True)
+    for stu in sorted(d.students.values(), key=lambda s: s.name):
+        text = d.format_student_detailed(stu, weeks, numbers, buckets[stu.name])
+        (PATH_OUTPUT / f'{stu.name}.txt').write_text(text, encoding='utf-8')
+        d.save_student_workbook(stu, weeks, numbers, buckets[stu.name], PATH_OUTPUT / f'{stu.name}.xlsx')
+
+    print(f'Saved {len(d.students)} student report(s) to {PATH_OUTPUT}')
 
 # Go
 
@@ -387,3 +640,4 @@ if __name__ == '__main__':
     mark_class()
     # mark_student()
     # mark_student_detailed()
+    # mark_students()
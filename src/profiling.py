@@ -0,0 +1,115 @@
+# =============================================================================
+#
+# PROFILING
+#
+# Opt-in timing of each marking stage, plus a few counters. Nothing is
+# recorded until the profiler is enabled. The trace is written in Chrome's
+# trace event format, so it opens in chrome://tracing or ui.perfetto.dev as
+# well as being plain JSON.
+#
+# =============================================================================
+
+from __future__ import annotations
+import contextlib
+import datetime
+import functools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+# Classes
+
+class Profiler:
+    enabled: bool
+    started: float
+    events: list[dict]
+    counts: dict[str, int]
+
+    def __init__(self: Profiler) -> None:
+        self.enabled = False
+        self.reset()
+
+    def reset(self: Profiler) -> None:
+        self.started = time.perf_counter()
+        self.events = []
+        self.counts = {}
+
+    def enable(self: Profiler) -> None:
+        if not self.enabled:
+            self.enabled = True
+            self.reset()
+
+    @contextlib.contextmanager
+    def stage(self: Profiler, name: str, **info: object) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': round((start - self.started) * 1e6),
+                'dur': round((end - start) * 1e6),
+                'pid': os.getpid(),
+                'tid': 0,
+                'args': {k: str(v) for (k, v) in info.items()},
+            })
+
+    def timed(self: Profiler, name: str) -> Callable:
+        """
+        Decorator form of stage, for a whole function.
+        """
+        def decorate(f: Callable) -> Callable:
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+
+                with self.stage(name):
+                    return f(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def count(self: Profiler, name: str, n: int=1) -> None:
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def summarize(self: Profiler) -> dict[str, dict[str, float]]:
+        totals = {}
+        for e in self.events:
+            t = totals.setdefault(e['name'], {'calls': 0, 'seconds': 0.0})
+            t['calls'] += 1
+            t['seconds'] += e['dur'] / 1e6
+
+        return totals
+
+    def save(self: Profiler, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        trace = {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'written': datetime.datetime.now().isoformat(timespec='seconds'),
+                'seconds': round(time.perf_counter() - self.started, 6),
+                'counts': self.counts,
+                'stages': self.summarize(),
+            },
+        }
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, indent=1)
+
+        print(f'Saved trace to {path}')
+
+# The one every module records into
+profiler = Profiler()
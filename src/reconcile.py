@@ -0,0 +1,202 @@
+# =============================================================================
+#
+# RECONCILE
+#
+# Measures the gap between the two sources of XP: the main panel exports
+# that process.py reads and the activity panel pastes that
+# process_from_activity.py reads. The main panel is said to always have the
+# same or more, and this shows where it doesn't.
+#
+# Both sources land in the same students x weeks layout, on the main panel's
+# weeks and roster, so comparing them is a single pass over two matrices.
+# Activity pastes (*.txt) sit in the same input/ as the exports, and their
+# students block can share variables.txt with the main panel's aliases.
+#
+# =============================================================================
+
+from __future__ import annotations
+import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import process_from_activity
+from aliases import normalize
+from export import write_csv
+from process import FMT_DATE_OUTPUT
+from render import Column, Sink
+
+if TYPE_CHECKING:
+    import numpy as np
+    from process import DuolingoMarker
+
+XP_COLUMNS = [Column('Main', 8), Column('Activity', 8), Column('Diff', 8)]
+
+# Classes
+
+class Reconciliation:
+    """
+    Students in rows and the main panel's weeks in columns, one matrix per source.
+    """
+    names: list[str]
+    weeks: list[tuple[datetime.date]]
+    numbers: list[str]
+    main: np.ndarray
+    activity: np.ndarray
+    unmatched: dict[str, int]
+    outside: int
+
+    def __init__(self: Reconciliation, names: list[str], weeks: list[tuple[datetime.date]], numbers: list[str], main: np.ndarray, activity: np.ndarray, unmatched: dict[str, int], outside: int) -> None:
+        """
+        unmatched is activity XP per username that isn't a student; outside is activity XP in no main panel week.
+        """
+        self.names = names
+        self.weeks = weeks
+        self.numbers = numbers
+        self.main = main
+        self.activity = activity
+        self.unmatched = unmatched
+        self.outside = outside
+
+    def get_student_rows(self: Reconciliation) -> list[list]:
+        """
+        Every student with a difference in any week, biggest shortfall in the main panel first.
+        """
+        diff = self.main - self.activity
+        short = (diff < 0).sum(axis=1)
+        rows = zip(self.names, self.main.sum(axis=1).tolist(), self.activity.sum(axis=1).tolist(), (diff != 0).sum(axis=1).tolist(), short.tolist())
+
+        return sorted(
+            ([name, main, activity, main - activity, weeks, short] for (name, main, activity, weeks, short) in rows if weeks),
+            key=lambda row: (row[3], row[0])
+        )
+
+    def get_week_rows(self: Reconciliation) -> list[list]:
+        diff = self.main - self.activity
+        columns = zip(self.main.sum(axis=0).tolist(), self.activity.sum(axis=0).tolist(), (diff != 0).sum(axis=0).tolist(), (diff < 0).sum(axis=0).tolist())
+
+        return [
+            [number.strip(), start, end, main, activity, main - activity, students, short]
+            for (number, (start, end), (main, activity, students, short)) in zip(self.numbers, self.weeks, columns)
+        ]
+
+# Operations
+
+def reconcile(d: DuolingoMarker, workers: int=1) -> Reconciliation:
+    """
+    d is a marker that has read the main panel. The activity pastes are read fresh.
+    """
+    import numpy as np
+
+    calendar = d.get_calendar()
+    students = d.get_sorted_students()
+    rows = {stu.name: i for (i, stu) in enumerate(students)}
+
+    main = d.get_xp_matrix(students, calendar)
+    activity = np.zeros_like(main)
+
+    # The activity panel names students its own way, in its own students block
+    a = process_from_activity.DuolingoMarker()
+    a.parse_variables(d.path_variables)
+
+    paths = sorted(p for p in d.path_input.glob('*.txt') if not p.stem.startswith('_'))
+    parsed = process_from_activity.read_input_files(paths, workers)
+
+    names = {}
+    practices = set()
+    unmatched = {}
+    outside = 0
+    cells_i = []
+    cells_j = []
+    cells_xp = []
+
+    for (_, records, _, _) in parsed:
+        for (alias, desc, xp, dt) in records:
+            if alias not in names:
+                names[alias] = resolve_activity_alias(d, a, alias)
+
+            name = names[alias]
+
+            # Fingerprints only catch repeats within one worker's files. This is the activity
+            # script's Practice set, which also catches a record under two of a student's aliases
+            practice = (name or alias, desc, xp, dt)
+            if practice in practices:
+                continue
+
+            practices.add(practice)
+
+            if name is None:
+                unmatched[alias] = unmatched.get(alias, 0) + xp
+                continue
+
+            j = calendar.week_of(dt)
+            if j < 0:
+                outside += xp
+                continue
+
+            cells_i.append(rows[name])
+            cells_j.append(j)
+            cells_xp.append(xp)
+
+    np.add.at(activity, (np.array(cells_i, dtype=np.intp), np.array(cells_j, dtype=np.intp)), np.array(cells_xp, dtype=np.int64))
+
+    numbers = [calendar.label_of(start) for (start, _) in calendar.weeks]
+    return Reconciliation([stu.name for stu in students], calendar.weeks, numbers, main, activity, unmatched, outside)
+
+def resolve_activity_alias(d: DuolingoMarker, a: process_from_activity.DuolingoMarker, alias: str) -> str | None:
+    """
+    The main panel's student for an activity panel name, or None.
+    """
+    stu = a.aliases.get(alias)
+    if stu is not None:
+        return stu.name if stu.name in d.students else None
+
+    # Otherwise the name might be one the main panel already knows
+    key = normalize(alias)
+    if key in d.skips:
+        return None
+
+    stu = d.aliases.get(key) or d.students.get(key)
+    return stu and stu.name
+
+def render_reconciliation(sink: Sink, r: Reconciliation) -> None:
+    main = int(r.main.sum())
+    activity = int(r.activity.sum())
+    name_fill = max(map(len, r.names), default=0)
+
+    sink.heading('RECONCILIATION')
+    sink.fields([
+        ('Main panel XP:', main),
+        ('Activity panel XP:', activity),
+        ('Difference:', main - activity),
+        ('Student weeks where the activity panel has more:', int((r.main < r.activity).sum())),
+    ])
+
+    weeks = (
+        (number, f'{start.strftime(FMT_DATE_OUTPUT)} to {end.strftime(FMT_DATE_OUTPUT)}', main, activity, diff, students, short)
+        for (number, start, end, main, activity, diff, students, short) in r.get_week_rows()
+    )
+    sink.table(
+        [Column('Week', 4), Column('Dates', 36), *XP_COLUMNS, Column('Students', 8), Column('Short', 5)],
+        weeks, title='WEEKS'
+    )
+
+    rows = r.get_student_rows()
+    sink.table(
+        [Column('Name', name_fill), *XP_COLUMNS, Column('Weeks', 5), Column('Short', 5)],
+        rows, title=f'STUDENTS WITH DIFFERENCES ({len(rows)} of {len(r.names)})'
+    )
+
+    if r.unmatched:
+        sink.table([Column('Name'), Column('XP')], sorted(r.unmatched.items()), title="ACTIVITY NAMES THAT AREN'T STUDENTS", header=False, sep=': ')
+
+    if r.outside:
+        sink.fields([("Activity XP outside the main panel's weeks:", r.outside)])
+
+def save_reconciliation(r: Reconciliation, directory: Path) -> list[Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [directory / 'reconcile students.csv', directory / 'reconcile weeks.csv']
+
+    write_csv(paths[0], ['student', 'main xp', 'activity xp', 'difference', 'weeks different', 'weeks short'], r.get_student_rows())
+    write_csv(paths[1], ['week', 'start', 'end', 'main xp', 'activity xp', 'difference', 'students different', 'students short'], r.get_week_rows())
+
+    return paths
@@ -0,0 +1,170 @@
+# =============================================================================
+#
+# RENDER
+#
+# Writes reports straight to a file (or stdout) a block at a time, so a
+# report is never built up as one big string. A report is a series of
+# blocks: headings, label-value fields, tables and short paragraphs. Each
+# sink lays those out its own way:
+#
+#   text      fixed-width columns, as the reports have always looked
+#   markdown  headings, bullet lists and pipe tables
+#   csv       one row per line of the report
+#
+# =============================================================================
+
+from __future__ import annotations
+import csv
+import io
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Sequence, TextIO
+
+# Classes
+
+class Column:
+    title: str
+    width: int
+    align: str
+
+    def __init__(self: Column, title: str, width: int=0, align: str='<') -> None:
+        """
+        width and align ('<' or '>') only matter to fixed-width text.
+        """
+        self.title = title
+        self.width = width
+        self.align = align
+
+class Sink(ABC):
+    out: TextIO
+    started: bool
+
+    def __init__(self: Sink, out: TextIO) -> None:
+        self.out = out
+        self.started = False
+
+    def begin(self: Sink) -> None:
+        """
+        Called at the start of each block; every block after the first is set apart.
+        """
+        if self.started:
+            self.separate()
+
+        self.started = True
+
+    def separate(self: Sink) -> None:
+        self.out.write('\n')
+
+    @abstractmethod
+    def heading(self: Sink, text: str) -> None:
+        ...
+
+    @abstractmethod
+    def fields(self: Sink, pairs: list[tuple[str, object]]) -> None:
+        ...
+
+    @abstractmethod
+    def table(self: Sink, columns: list[Column], rows: Iterable[Sequence], title: str | None=None, header: bool=True, sep: str=' : ') -> None:
+        """
+        header and sep are for fixed-width text; the other sinks always name their columns.
+        """
+
+    @abstractmethod
+    def paragraph(self: Sink, lines: list[str]) -> None:
+        ...
+
+class TextSink(Sink):
+    def heading(self: TextSink, text: str) -> None:
+        self.begin()
+        self.out.write(f'{text}\n')
+
+    def fields(self: TextSink, pairs: list[tuple[str, object]]) -> None:
+        self.begin()
+        width = max(len(label) for (label, _) in pairs) + 1
+        self.out.writelines(f'{label.ljust(width)}{value}\n' for (label, value) in pairs)
+
+    def table(self: TextSink, columns: list[Column], rows: Iterable[Sequence], title: str | None=None, header: bool=True, sep: str=' : ') -> None:
+        self.begin()
+        template = sep.join(f'{{:{c.align}{c.width}}}' for c in columns) + '\n'
+
+        if title:
+            self.out.write(f'{title}\n')
+
+        if header:
+            line = template.format(*(c.title for c in columns))
+            self.out.write(line)
+            self.out.write('=' * (len(line) - 1) + '\n')
+
+        self.out.writelines(template.format(*row) for row in rows)
+
+    def paragraph(self: TextSink, lines: list[str]) -> None:
+        self.begin()
+        self.out.writelines(f'{line}\n' for line in lines)
+
+class MarkdownSink(Sink):
+    def heading(self: MarkdownSink, text: str) -> None:
+        self.begin()
+        self.out.write(f'## {text}\n')
+
+    def fields(self: MarkdownSink, pairs: list[tuple[str, object]]) -> None:
+        self.begin()
+        self.out.writelines(f'- {label} {value}\n' for (label, value) in pairs)
+
+    def table(self: MarkdownSink, columns: list[Column], rows: Iterable[Sequence], title: str | None=None, header: bool=True, sep: str=' : ') -> None:
+        self.begin()
+
+        if title:
+            self.out.write(f'**{title}**\n\n')
+
+        self.out.write('| ' + ' | '.join(c.title for c in columns) + ' |\n')
+        self.out.write('|' + '|'.join('---:' if c.align == '>' else '---' for c in columns) + '|\n')
+        self.out.writelines('| ' + ' | '.join(str(v).replace('|', '\\|') for v in row) + ' |\n' for row in rows)
+
+    def paragraph(self: MarkdownSink, lines: list[str]) -> None:
+        self.begin()
+
+        # Trailing double spaces keep the lines apart
+        self.out.write('  \n'.join(lines) + '\n')
+
+class CsvSink(Sink):
+    writer: csv.writer
+
+    def __init__(self: CsvSink, out: TextIO) -> None:
+        super().__init__(out)
+        self.writer = csv.writer(out, lineterminator='\n')
+
+    def separate(self: CsvSink) -> None:
+        self.writer.writerow([])
+
+    def heading(self: CsvSink, text: str) -> None:
+        self.begin()
+        self.writer.writerow([text])
+
+    def fields(self: CsvSink, pairs: list[tuple[str, object]]) -> None:
+        self.begin()
+        self.writer.writerows([label.rstrip(':'), value] for (label, value) in pairs)
+
+    def table(self: CsvSink, columns: list[Column], rows: Iterable[Sequence], title: str | None=None, header: bool=True, sep: str=' : ') -> None:
+        self.begin()
+
+        if title:
+            self.writer.writerow([title])
+
+        self.writer.writerow([c.title for c in columns])
+        self.writer.writerows(rows)
+
+    def paragraph(self: CsvSink, lines: list[str]) -> None:
+        self.begin()
+        self.writer.writerow(lines)
+
+SINKS = {'text': TextSink, 'markdown': MarkdownSink, 'csv': CsvSink}
+EXTENSIONS = {'text': 'txt', 'markdown': 'md', 'csv': 'csv'}
+
+# Operations
+
+def to_string(render: Callable[[Sink], None]) -> str:
+    """
+    Fixed-width text, without the last line's newline, for the format_* functions that return strings.
+    """
+    out = io.StringIO()
+    render(TextSink(out))
+    return out.getvalue().removesuffix('\n')
@@ -0,0 +1,299 @@
+# =============================================================================
+#
+# SERVER
+#
+# Keeps one classroom's marker in memory and answers for it over HTTP on
+# localhost, so a query costs a lookup instead of a full reparse:
+#
+#   GET /weeks              every week, oldest first
+#   GET /weeks/<n>          one week's class report, n as in --weeks
+#   GET /students           every student's name
+#   GET /students/<name>    one student's weeks
+#   GET /final              the final report
+#   GET /final.xlsx         the final report as a workbook
+#   GET /metrics            requests, cache hits and latencies per route
+#
+# Every answer is JSON except the workbook. Answers are kept until input/
+# changes: before each request the input files are checked, only the files
+# that changed are read again, and only the answers they could affect are
+# dropped. A file that can't be read is left out, with the last good
+# answers kept, and listed under /metrics until it reads cleanly.
+#
+# =============================================================================
+
+from __future__ import annotations
+import datetime
+import json
+import statistics
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+from urllib.parse import unquote, urlsplit
+
+import watch
+
+if TYPE_CHECKING:
+    from process import DuolingoMarker
+
+HOST = '127.0.0.1'
+PORT = 8421
+
+# Latest requests per route that the percentiles are taken over
+LATENCY_SAMPLES = 1000
+
+TYPE_JSON = 'application/json'
+TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# (status, content type, body)
+Response = tuple[int, str, bytes]
+
+# Classes
+
+class ReportService:
+    d: DuolingoMarker
+    snapshot: watch.Snapshot
+    responses: dict[tuple, Response]
+    stats: dict[str, dict[str, int]]
+    latencies: dict[str, deque[float]]
+    reloads: int
+    failures: dict[str, str]
+    lock: threading.Lock
+
+    def __init__(self: ReportService, d: DuolingoMarker) -> None:
+        self.d = d
+        self.snapshot = watch.snapshot(d.get_input_paths())
+        self.responses = {}
+        self.stats = {}
+        self.latencies = {}
+        self.reloads = 0
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def handle(self: ReportService, target: str) -> Response:
+        start = time.perf_counter()
+        parts = [unquote(p) for p in urlsplit(target).path.split('/') if p]
+        route = '/' + '/'.join(parts[:1])
+        if len(parts) > 1:
+            route += '/<n>' if parts[0] == 'weeks' else '/<name>'
+
+        with self.lock:
+            try:
+                # The metrics are wanted most when input/ is in a bad way, so they don't wait on it
+                if parts != ['metrics']:
+                    self.refresh()
+
+                response, hit = self.respond(parts)
+            except Exception as e:
+                response, hit = make_json(500, {'error': f'{type(e).__name__}: {e}'}), False
+
+            self.record(route, response[0], hit, time.perf_counter() - start)
+
+        return response
+
+    def respond(self: ReportService, parts: list[str]) -> tuple[Response, bool]:
+        """
+        The response, and whether it came from the cache.
+        """
+        if parts == ['metrics']:
+            return make_json(200, self.get_metrics()), False
+
+        key = self.get_key(parts)
+        if key is None:
+            return make_json(404, {'error': 'Not found'}), False
+
+        response = self.responses.get(key)
+        if response is not None:
+            return response, True
+
+        response = self.build(key)
+        if response[0] == 200:
+            self.responses[key] = response
+
+        return response, False
+
+    def get_key(self: ReportService, parts: list[str]) -> tuple | None:
+        """
+        What a response is cached under: weeks by start date, so they keep their answers when new weeks arrive.
+        """
+        weeks = self.d.get_weeks() or []
+
+        match parts:
+            case ['weeks']:
+                return ('weeks',)
+            case ['weeks', n] if n.isdigit() and 1 <= int(n) <= len(weeks):
+                return ('week', weeks[int(n) - 1][0])
+            case ['students']:
+                return ('students',)
+            case ['students', name] if name.lower() in self.d.students:
+                return ('student', name.lower())
+            case ['final']:
+                return ('final',)
+            case ['final.xlsx'] if weeks:
+                return ('final.xlsx',)
+
+        return None
+
+    def build(self: ReportService, key: tuple) -> Response:
+        d = self.d
+        calendar = d.get_calendar()
+        weeks = calendar.weeks
+        numbers = [calendar.label_of(start) for (start, _) in weeks]
+
+        match key:
+            case ('weeks',):
+                return make_json(200, [
+                    {'n': i + 1, 'number': number.strip(), 'start': start, 'end': end}
+                    for (i, ((start, end), number)) in enumerate(zip(weeks, numbers))
+                ])
+
+            case ('week', start):
+                i = calendar.week_of(start)
+                end = weeks[i][1]
+                students = d.get_sorted_students()
+                xps = d.get_xp_matrix(students, calendar, [i])[:, 0].tolist()
+
+                return make_json(200, {
+                    'n': i + 1, 'number': numbers[i].strip(), 'start': start, 'end': end,
+                    'xp': dict(zip((stu.name for stu in students), xps)),
+                    'text': d.format_week(start, end, numbers[i], xps, students),
+                })
+
+            case ('students',):
+                return make_json(200, sorted(d.students))
+
+            case ('student', name):
+                stu = d.students[name]
+                xps = d.get_xp_matrix([stu], calendar)[0].tolist()
+
+                return make_json(200, {
+                    'name': name,
+                    'weeks': [
+                        {'n': i + 1, 'number': number.strip(), 'start': start, 'end': end, 'xp': xp}
+                        for (i, ((start, end), number, xp)) in enumerate(zip(weeks, numbers, xps))
+                    ],
+                    'text': d.format_student_weeks(stu, weeks, numbers, xps),
+                })
+
+            case ('final',):
+                return make_json(200, d.calculate_final_report())
+
+            case ('final.xlsx',):
+                d.save_final_report()
+                return 200, TYPE_XLSX, (d.path_output / 'final_report.xlsx').read_bytes()
+
+    def refresh(self: ReportService) -> None:
+        """
+        Read whatever has changed in input/ and drop the answers it could change.
+        A file that fails keeps what was read from it before, and is tried again once it changes.
+        """
+        now = watch.snapshot(self.d.get_input_paths())
+        changed = watch.diff_snapshots(self.snapshot, now)
+        if not changed:
+            return
+
+        d = self.d
+        before = (d.get_weeks(), d.get_week_numbers(d.get_weeks() or []))
+        keys = [str(path.resolve()) for path in changed]
+        spans = [d.files[key][1:] for key in keys if key in d.files]
+
+        if d.store is not None:
+            try:
+                d.parse_input_files()
+                for path in changed:
+                    self.failures.pop(path.name, None)
+            except Exception as e:
+                self.failures.update((path.name, f'{type(e).__name__}: {e}') for path in changed)
+        else:
+            for path in sorted(changed):
+                try:
+                    d.parse_input_file(path)
+                    self.failures.pop(path.name, None)
+                except Exception as e:
+                    self.failures[path.name] = f'{type(e).__name__}: {e}'
+
+        self.snapshot = now
+        self.reloads += 1
+        spans += [d.files[key][1:] for key in keys if key in d.files]
+
+        # New or renumbered weeks change every answer
+        if (d.get_weeks(), d.get_week_numbers(d.get_weeks() or [])) != before:
+            self.responses = {}
+            return
+
+        calendar = d.get_calendar()
+        for key in list(self.responses):
+            if key in (('weeks',), ('students',)):
+                continue
+
+            # Only the weeks the changed files cover, before or after the change
+            if key[0] == 'week':
+                start, end = calendar.weeks[calendar.week_of(key[1])]
+                if not any(first <= end and start <= last for (first, last) in spans):
+                    continue
+
+            del self.responses[key]
+
+    def record(self: ReportService, route: str, status: int, hit: bool, seconds: float) -> None:
+        stats = self.stats.setdefault(route, {'requests': 0, 'errors': 0, 'cache hits': 0})
+        stats['requests'] += 1
+        stats['errors'] += status >= 400
+        stats['cache hits'] += hit
+
+        self.latencies.setdefault(route, deque(maxlen=LATENCY_SAMPLES)).append(seconds * 1000)
+
+    def get_metrics(self: ReportService) -> dict[str]:
+        routes = {}
+
+        for (route, stats) in sorted(self.stats.items()):
+            ms = sorted(self.latencies[route])
+            routes[route] = stats | {
+                'p50 ms': round(statistics.median(ms), 3),
+                'p95 ms': round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+                'max ms': round(ms[-1], 3),
+            }
+
+        return {
+            'reloads': self.reloads, 'cached responses': len(self.responses),
+            'failed files': dict(sorted(self.failures.items())), 'routes': routes,
+        }
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service: ReportService
+
+    def do_GET(self: RequestHandler) -> None:
+        status, content_type, body = self.service.handle(self.path)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# Helpers
+
+def make_json(status: int, data: object) -> Response:
+    return status, TYPE_JSON, json.dumps(data, default=encode_json).encode('utf-8')
+
+def encode_json(value: object) -> object:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    raise TypeError(f'Not JSON serializable: {type(value).__name__}')
+
+# Operations
+
+def serve(d: DuolingoMarker, host: str=HOST, port: int=PORT) -> None:
+    """
+    Runs until interrupted.
+    """
+    handler = type('Handler', (RequestHandler,), {'service': ReportService(d)})
+
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print(f'Serving {d.path_input} on http://{host}:{port}/ (Ctrl+C to stop)')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print('\nStopped')
@@ -0,0 +1,135 @@
+# =============================================================================
+#
+# TIMESTAMPS
+#
+# Turns the date and time of an activity record into a datetime without
+# going through strptime, which is slow enough to dominate reading a paste.
+# The date and the time come straight from the date regex's groups. Each is
+# worked out the first time it's seen and looked up after that: there are a
+# few hundred dates in a year of pastes and 1440 minutes in a day, and a
+# datetime is then the date's midnight plus the time.
+#
+# Month names can be English, French, Spanish, Portuguese, German or
+# Italian, abbreviated or in full, but the date must still be month first,
+# as in 'oct. 5, 2024'. Anything the tables don't cover is left to the
+# caller, so that strptime keeps the last word.
+#
+# =============================================================================
+
+from __future__ import annotations
+import datetime
+import re
+
+# Each month's spellings, lowercase and without the final dot
+MONTH_NAMES = {
+    'en': [
+        ['jan', 'january'], ['feb', 'february'], ['mar', 'march'], ['apr', 'april'],
+        ['may'], ['jun', 'june'], ['jul', 'july'], ['aug', 'august'],
+        ['sep', 'sept', 'september'], ['oct', 'october'], ['nov', 'november'], ['dec', 'december'],
+    ],
+    'fr': [
+        ['janv', 'janvier'], ['févr', 'fevr', 'février', 'fevrier'], ['mars'], ['avr', 'avril'],
+        ['mai'], ['juin'], ['juil', 'juillet'], ['août', 'aout'],
+        ['sept', 'septembre'], ['oct', 'octobre'], ['nov', 'novembre'], ['déc', 'dec', 'décembre', 'decembre'],
+    ],
+    'es': [
+        ['ene', 'enero'], ['feb', 'febrero'], ['mar', 'marzo'], ['abr', 'abril'],
+        ['may', 'mayo'], ['jun', 'junio'], ['jul', 'julio'], ['ago', 'agosto'],
+        ['sep', 'sept', 'septiembre'], ['oct', 'octubre'], ['nov', 'noviembre'], ['dic', 'diciembre'],
+    ],
+    'pt': [
+        ['jan', 'janeiro'], ['fev', 'fevereiro'], ['mar', 'março', 'marco'], ['abr', 'abril'],
+        ['mai', 'maio'], ['jun', 'junho'], ['jul', 'julho'], ['ago', 'agosto'],
+        ['set', 'setembro'], ['out', 'outubro'], ['nov', 'novembro'], ['dez', 'dezembro'],
+    ],
+    'de': [
+        ['jan', 'januar'], ['feb', 'februar'], ['mär', 'märz', 'maerz'], ['apr', 'april'],
+        ['mai'], ['jun', 'juni'], ['jul', 'juli'], ['aug', 'august'],
+        ['sep', 'sept', 'september'], ['okt', 'oktober'], ['nov', 'november'], ['dez', 'dezember'],
+    ],
+    'it': [
+        ['gen', 'gennaio'], ['feb', 'febbraio'], ['mar', 'marzo'], ['apr', 'aprile'],
+        ['mag', 'maggio'], ['giu', 'giugno'], ['lug', 'luglio'], ['ago', 'agosto'],
+        ['set', 'settembre'], ['ott', 'ottobre'], ['nov', 'novembre'], ['dic', 'dicembre'],
+    ],
+}
+
+MONTHS = {
+    name: i + 1
+    for months in MONTH_NAMES.values()
+    for (i, names) in enumerate(months)
+    for name in names
+}
+
+# Exactly the numbers strptime's %d, %H, %I and %M accept, with or without a leading zero
+DAYS = {str(n): n for n in range(1, 10)} | {f'{n:02}': n for n in range(1, 32)}
+HOURS_24 = {str(n): n for n in range(10)} | {f'{n:02}': n for n in range(24)}
+HOURS_12 = {str(n): n for n in range(1, 10)} | {f'{n:02}': n for n in range(1, 13)}
+MINUTES = {str(n): n for n in range(10)} | {f'{n:02}': n for n in range(60)}
+
+RE_DAY = re.compile(r'([^\W\d_]+)\.? (\d+), (\d+)')
+RE_TIME = re.compile(r'(\d+)(?: h |:)(\d+)(?: ([ap])\.m\.)?')
+
+# Dates already seen, at midnight, and times, since midnight; None where the tables can't tell
+DATES: dict[str, datetime.datetime | None] = {}
+TIMES: dict[str, datetime.timedelta | None] = {}
+
+# Operations
+
+def parse_timestamp(date: str, time: str) -> datetime.datetime | None:
+    """
+    date is like 'oct 5, 2024', lowercase as the paste is read; time is like '14 h 51' or '2:51 p.m.'.
+    None if the tables can't vouch for it.
+    """
+    # None is remembered too, so a prefix that doesn't parse is only tried once
+    try:
+        midnight = DATES[date]
+    except KeyError:
+        midnight = DATES[date] = parse_date(date)
+
+    try:
+        since = TIMES[time]
+    except KeyError:
+        since = TIMES[time] = parse_time(time)
+
+    if midnight is None or since is None:
+        return None
+
+    # Adding to a datetime is far quicker than making one
+    return midnight + since
+
+def parse_date(date: str) -> datetime.datetime | None:
+    match = RE_DAY.fullmatch(date)
+    if not match:
+        return None
+
+    month, day, year = match.groups()
+    m = MONTHS.get(month)
+    d = DAYS.get(day)
+
+    if m is None or d is None or len(year) != 4 or not (year.isascii() and year.isdigit()):
+        return None
+
+    # Feb 30 and the like are strptime's to reject
+    try:
+        return datetime.datetime(int(year), m, d)
+    except ValueError:
+        return None
+
+def parse_time(time: str) -> datetime.timedelta | None:
+    match = RE_TIME.fullmatch(time)
+    if not match:
+        return None
+
+    hour, minute, meridiem = match.groups()
+    h = (HOURS_24 if meridiem is None else HOURS_12).get(hour)
+    m = MINUTES.get(minute)
+
+    if h is None or m is None:
+        return None
+
+    # 12 a.m. is midnight and 12 p.m. noon
+    if meridiem is not None:
+        h = h % 12 + (12 if meridiem == 'p' else 0)
+
+    return datetime.timedelta(hours=h, minutes=m)
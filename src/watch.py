@@ -0,0 +1,64 @@
+# =============================================================================
+#
+# WATCH
+#
+# Polls a set of input files and reports which ones were added, changed or
+# removed, once they have stopped changing for a moment. Saving an export
+# often writes the file several times in a row; the debounce turns a burst
+# like that into one update.
+#
+# =============================================================================
+
+from __future__ import annotations
+import time
+from pathlib import Path
+from typing import Callable
+
+# Seconds between looks at the directory
+POLL_SECONDS = 1.0
+
+# Seconds with no further change before an update is sent
+DEBOUNCE_SECONDS = 2.0
+
+# (size, mtime) of each file
+Snapshot = dict[Path, tuple[int, int]]
+
+# Operations
+
+def snapshot(paths: list[Path]) -> Snapshot:
+    snap = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+
+        snap[path] = (stat.st_size, stat.st_mtime_ns)
+
+    return snap
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> set[Path]:
+    return set(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+def watch(list_paths: Callable[[], list[Path]], on_change: Callable[[set[Path]], None], poll: float=POLL_SECONDS, debounce: float=DEBOUNCE_SECONDS) -> None:
+    """
+    Runs until interrupted. Whatever is there at the start counts as already seen.
+    """
+    seen = snapshot(list_paths())
+    pending = set()
+    last_change = 0.0
+
+    while True:
+        time.sleep(poll)
+
+        now = snapshot(list_paths())
+        changed = diff_snapshots(seen, now)
+        seen = now
+
+        if changed:
+            pending |= changed
+            last_change = time.monotonic()
+
+        elif pending and time.monotonic() - last_change >= debounce:
+            on_change(pending)
+            pending = set()
@@ -0,0 +1,89 @@
+# =============================================================================
+#
+# WEEK CACHE
+#
+# Keeps each week's XP column of the final report on disk, so that adding
+# this week's export only costs this week. A column is trusted as long as the
+# week has the same dates, the same input files (by content hash) touch it,
+# and the roster and aliases are unchanged; anything else recomputes it.
+#
+# =============================================================================
+
+from __future__ import annotations
+from pathlib import Path
+import datetime
+import os
+import pickle
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CACHE_VERSION = 2
+
+# ((path, hash), ...) of every input file whose dates overlap a week
+WeekFiles = tuple[tuple[str, str], ...]
+
+# Classes
+
+class WeekCache:
+    path: Path
+    roster: tuple
+    entries: dict[tuple[datetime.date, datetime.date], tuple[WeekFiles, np.ndarray]]
+    seen: set[tuple[datetime.date, datetime.date]]
+    dirty: bool
+
+    def __init__(self: WeekCache, path: Path, roster: tuple) -> None:
+        """
+        roster is whatever decides which row an XP lands in: every column follows it.
+        """
+        self.path = path
+        self.roster = roster
+        self.entries = {}
+        self.seen = set()
+        self.dirty = False
+
+    def load(self: WeekCache) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                version, roster, entries = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return
+
+        if version == CACHE_VERSION and roster == self.roster:
+            self.entries = entries
+
+        # A new student or alias moves XP between rows in every week
+        else:
+            self.dirty = True
+
+    def save(self: WeekCache) -> None:
+        if not self.dirty:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_suffix('.tmp')
+        with open(temp, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self.roster, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp, self.path)
+        self.dirty = False
+
+    def get(self: WeekCache, week: tuple[datetime.date, datetime.date], files: WeekFiles) -> np.ndarray | None:
+        self.seen.add(week)
+
+        entry = self.entries.get(week)
+        if entry is None or entry[0] != files:
+            return None
+
+        return entry[1]
+
+    def put(self: WeekCache, week: tuple[datetime.date, datetime.date], files: WeekFiles, xps: np.ndarray) -> None:
+        self.seen.add(week)
+        self.entries[week] = (files, xps)
+        self.dirty = True
+
+    def evict_unseen(self: WeekCache) -> None:
+        for week in set(self.entries) - self.seen:
+            del self.entries[week]
+            self.dirty = True
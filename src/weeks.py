@@ -0,0 +1,102 @@
+# =============================================================================
+#
+# WEEKS
+#
+# The marking weeks of one run, worked out once from the dates the input
+# files cover. A week runs from the first date after the previous week up to
+# the next Sunday among those dates (or the last date, if none is a Sunday),
+# and it takes in every moment of every day in between. Every report asks
+# this calendar which week a date falls in, so they all agree.
+#
+# =============================================================================
+
+from __future__ import annotations
+from array import array
+from typing import Iterable
+import datetime
+
+# Classes
+
+class WeekCalendar:
+    weeks: list[tuple[datetime.date, datetime.date]]
+    numbers: list[str]
+    bonus: set[int]
+    first: int
+    days: array
+
+    def __init__(self: WeekCalendar, dates: Iterable[datetime.date], bonus_weeks: Iterable[datetime.date], bonus_label: str='--') -> None:
+        """
+        A week with any of bonus_weeks in it is labelled bonus_label; the rest are numbered from 1.
+        """
+        self.weeks = group_weeks(sorted(dates))
+
+        # Week index of each day from the first week's start, -1 for days between weeks
+        self.first = self.weeks[0][0].toordinal() if self.weeks else 0
+        last = self.weeks[-1][1].toordinal() if self.weeks else -1
+        self.days = array('q', [-1]) * (last - self.first + 1)
+
+        for (i, (start, end)) in enumerate(self.weeks):
+            lo = start.toordinal() - self.first
+            hi = end.toordinal() - self.first + 1
+            self.days[lo:hi] = array('q', [i]) * (hi - lo)
+
+        self.bonus = set(i for i in map(self.week_of, bonus_weeks) if i >= 0)
+
+        self.numbers = []
+        n = 1
+        for i in range(len(self.weeks)):
+            if i in self.bonus:
+                self.numbers.append(bonus_label)
+            else:
+                self.numbers.append(f'{n:>2}')
+                n += 1
+
+    def __len__(self: WeekCalendar) -> int:
+        return len(self.weeks)
+
+    def week_of(self: WeekCalendar, when: datetime.date | datetime.datetime) -> int:
+        """
+        The index of the week a date or datetime falls in, or -1 if none.
+        """
+        day = when.toordinal() - self.first
+        return self.days[day] if 0 <= day < len(self.days) else -1
+
+    def label_of(self: WeekCalendar, when: datetime.date | datetime.datetime) -> str | None:
+        i = self.week_of(when)
+        return self.numbers[i] if i >= 0 else None
+
+    def count_required(self: WeekCalendar) -> int:
+        return len(self.weeks) - len(self.bonus)
+
+    def get_dt_bounds(self: WeekCalendar, i: int) -> tuple[datetime.datetime, datetime.datetime]:
+        return get_dt_bounds(*self.weeks[i])
+
+# Helpers
+
+def group_weeks(dates: list[datetime.date]) -> list[tuple[datetime.date, datetime.date]]:
+    """
+    dates must be sorted.
+    """
+    weeks = []
+    start = None
+
+    for date in dates:
+        if start is None:
+            start = date
+
+        # Sunday?
+        if date.weekday() == 6:
+            weeks.append((start, date))
+            start = None
+
+    # Didn't end on a Sunday?
+    if start is not None:
+        weeks.append((start, dates[-1]))
+
+    return weeks
+
+def get_dt_bounds(start: datetime.date, end: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    From the first moment of start to the last moment of end, for range queries on datetimes.
+    """
+    return datetime.datetime.combine(start, datetime.time.min), datetime.datetime.combine(end, datetime.time.max)